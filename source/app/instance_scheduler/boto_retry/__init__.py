@@ -4,37 +4,96 @@
 
 
 import os
+import threading
+import weakref
 
 import boto3
 import botocore.config
 
+ENV_MAX_POOL_CONNECTIONS = "BOTO_MAX_POOL_CONNECTIONS"
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+
+
+def parse_max_pool_connections(value):
+    """
+    Returns the size of the connection pool for boto clients and resources
+    :param value: value of the environment variable that can override the default size, None if not set
+    :return: pool size, the default size if the value is not set or is not a positive number
+    """
+    try:
+        size = int(value)
+        if size > 0:
+            return size
+    except (TypeError, ValueError):
+        pass
+    return DEFAULT_MAX_POOL_CONNECTIONS
+
+
+# environment settings do not change within a Lambda container, so the pool size is parsed once
+MAX_POOL_CONNECTIONS = parse_max_pool_connections(os.getenv(ENV_MAX_POOL_CONNECTIONS))
+
+# all clients share a single config
+# a larger connection pool with keep-alive lets the many calls made in a scheduler run reuse open connections
+_STANDARD_RETRIES_CONFIG = botocore.config.Config(
+    user_agent_extra=os.getenv("USER_AGENT_EXTRA", None),
+    retries={"max_attempts": 5, "mode": "standard"},
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    tcp_keepalive=True,
+)
+
+# clients created for the default session, keyed by service and region
+_CLIENT_CACHE = {}
+# clients created for explicitly passed sessions, entries are released with the session
+_SESSION_CLIENT_CACHE = weakref.WeakKeyDictionary()
+_default_session = None
+# boto3 sessions are not thread safe, clients are created under this lock (the clients themselves are thread safe)
+_client_lock = threading.RLock()
+
+
+def default_session():
+    """
+    Returns the boto3 session that is shared by all clients that are not created for an explicit session
+    :return: default boto3 session
+    """
+    global _default_session
+    with _client_lock:
+        if _default_session is None:
+            _default_session = boto3.Session()
+        return _default_session
+
 
 def get_client_with_standard_retry(service_name, region=None, session=None):
     """
     Creates a bot3 client for the specified service name and region. The return client will have additional method for the
     specified methods that are wrapped with the logic of the specified wait strategy or the default strategy for that service.
     The method names must be valid for the boto3 service client. The name of the added functions is the name of the original
-    function plus the (default) value of method_suffix parameter
+    function plus the (default) value of method_suffix parameter. Clients are cached per service, region and session so
+    repeated calls in a (warm) Lambda container reuse the client and its connections.
     :param service_name: Name of the service
     :param region: Region for the client
-    :param session: Boto3 session, if None a new session will be created
+    :param session: Boto3 session, if None the shared default session is used
     :return: Client for the service with additional method that use retry logic
     """
-    args = {
-        "service_name": service_name,
-        "region_name": region,
-        "config": standard_retries_client_config(),
-    }
-
-    aws_session = session if session is not None else boto3.Session()
+    with _client_lock:
+        if session is None:
+            clients = _CLIENT_CACHE
+            aws_session = default_session()
+        else:
+            clients = _SESSION_CLIENT_CACHE.setdefault(session, {})
+            aws_session = session
 
-    result = aws_session.client(**args)
+        key = (service_name, region)
+        client = clients.get(key)
+        if client is None:
+            client = aws_session.client(
+                service_name=service_name,
+                region_name=region,
+                config=standard_retries_client_config(),
+            )
+            clients[key] = client
 
-    return result
+        return client
 
 
 def standard_retries_client_config():
-    return botocore.config.Config(
-        user_agent_extra=os.getenv("USER_AGENT_EXTRA", None),
-        retries={"max_attempts": 5, "mode": "standard"},
-    )
+    return _STANDARD_RETRIES_CONFIG
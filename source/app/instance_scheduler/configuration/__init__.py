@@ -163,7 +163,7 @@ def get_scheduler_configuration(logger):
         configdata = ConfigDynamodbAdapter(os.getenv(ENV_CONFIG)).config
         __configuration = SchedulerConfigBuilder(logger=logger).build(configdata)
         if logger is not None:
-            logger.debug("Configuration loaded\n{}", str(__configuration))
+            logger.debug("Configuration loaded\n{}", __configuration)
     return __configuration
 
 
@@ -3,8 +3,9 @@
 # SPDX-License-Identifier: Apache-2.0
 
 
-import copy
+import functools
 import os
+import re
 from datetime import datetime
 
 from instance_scheduler import configuration
@@ -31,7 +32,13 @@ INF_SCHEDULE_DISPLAY = (
     'Remote Account Ids = "{}"'
 )
 
-TAG_VAL_STR = "{{{}}}"
+# tags using these prefixes are reserved and can not be set on resources
+RESERVED_TAG_PREFIXES = ("aws:", "cloudformation:")
+
+# matches key=value pairs in a tag template, values may contain commas that are not followed by a next key=
+TAG_KEY_VALUE_RE = re.compile(r"(?:^|,)([^,=]*)=(.*?)(?=,[^,=]*=|\Z)", re.DOTALL)
+# matches {name} placeholders in tag values
+TAG_VAR_RE = re.compile(r"\{([^}]+)\}")
 
 
 class SchedulerConfig:
@@ -100,12 +107,12 @@ class SchedulerConfig:
         self._service_settings = None
         self.started_tags = (
             []
-            if started_tags in ["" or None]
+            if not started_tags
             else self.tag_list(self.build_tags_from_template(started_tags))
         )
         self.stopped_tags = (
             []
-            if stopped_tags in ["" or None]
+            if not stopped_tags
             else self.tag_list(self.build_tags_from_template(stopped_tags))
         )
 
@@ -115,54 +122,27 @@ class SchedulerConfig:
         :param name: name of the schedule
         :return: Schedule, None f it does not exist
         """
-        return self.schedules[name] if name in self.schedules else None
+        return self.schedules.get(name)
 
     @classmethod
     def build_tags_from_template(cls, tags_str, tag_variables=None):
-        lastkey = None
-        tags = {}
-        for tag in tags_str.split(","):
-            if "=" in tag:
-                t = tag.partition("=")
-                tags[t[0]] = t[2]
-                lastkey = t[0]
-            elif lastkey is not None:
-                tags[lastkey] = ",".join([tags[lastkey], tag])
-
-        tag_vars = {} if tag_variables is None else copy.copy(tag_variables)
-
-        dt = datetime.utcnow()
-        tag_vars.update(
-            {
-                configuration.TAG_VAL_SCHEDULER: os.getenv(configuration.ENV_STACK, ""),
-                configuration.TAG_VAL_YEAR: "{:0>4d}".format(dt.year),
-                configuration.TAG_VAL_MONTH: "{:0>2d}".format(dt.month),
-                configuration.TAG_VAL_DAY: "{:0>2d}".format(dt.day),
-                configuration.TAG_VAL_HOUR: "{:0>2d}".format(dt.hour),
-                configuration.TAG_VAL_MINUTE: "{:0>2d}".format(dt.minute),
-                configuration.TAG_VAL_TIMEZONE: "UTC",
-            }
+        # results are cached per minute, which is the smallest unit of time that can be used in a template
+        dt = datetime.utcnow().replace(second=0, microsecond=0)
+        return dict(
+            _build_tags_from_template(
+                tags_str,
+                tuple(tag_variables.items()) if tag_variables else (),
+                dt,
+                os.getenv(configuration.ENV_STACK, ""),
+            )
         )
 
-        for tag in tags:
-            value = tags[tag]
-            if value not in ["", None]:
-                for v in tag_vars:
-                    tags[tag] = tags[tag].replace(TAG_VAL_STR.format(v), tag_vars[v])
-        return tags
-
     @classmethod
     def tag_list(cls, tags_dict):
-        valid_tags = {
-            tag_key: tags_dict[tag_key]
-            for tag_key in tags_dict
-            if not (tag_key.startswith("aws:") or tag_key.startswith("cloudformation:"))
-        }
-        return (
-            [{"Key": t, "Value": tags_dict[t]} for t in tags_dict]
-            if valid_tags is not None
-            else []
-        )
+        return [
+            {"Key": key, "Value": value}
+            for key, value in _tag_list(tuple(tags_dict.items()))
+        ]
 
     def __str__(self):
         s = INF_SCHEDULE_DISPLAY.format(
@@ -186,3 +166,42 @@ class SchedulerConfig:
         )
 
         return s
+
+
+@functools.lru_cache(maxsize=32)
+def _build_tags_from_template(tags_str, tag_variables, dt, stack_name):
+    tags = {m.group(1): m.group(2) for m in TAG_KEY_VALUE_RE.finditer(tags_str)}
+
+    tag_vars = dict(tag_variables)
+
+    tag_vars.update(
+        {
+            configuration.TAG_VAL_SCHEDULER: stack_name,
+            configuration.TAG_VAL_YEAR: f"{dt.year:04d}",
+            configuration.TAG_VAL_MONTH: f"{dt.month:02d}",
+            configuration.TAG_VAL_DAY: f"{dt.day:02d}",
+            configuration.TAG_VAL_HOUR: f"{dt.hour:02d}",
+            configuration.TAG_VAL_MINUTE: f"{dt.minute:02d}",
+            configuration.TAG_VAL_TIMEZONE: "UTC",
+        }
+    )
+
+    def substitute(match):
+        # unknown placeholders are left as they are
+        return tag_vars.get(match.group(1), match.group(0))
+
+    for tag, value in tags.items():
+        # only values that contain a placeholder need substitution
+        if value and "{" in value:
+            tags[tag] = TAG_VAR_RE.sub(substitute, value)
+    # cached results are returned as tuples so they can not be modified by callers
+    return tuple(tags.items())
+
+
+@functools.lru_cache(maxsize=32)
+def _tag_list(tags):
+    return tuple(
+        (tag_key, tag_value)
+        for tag_key, tag_value in tags
+        if not tag_key.startswith(RESERVED_TAG_PREFIXES)
+    )
@@ -6,6 +6,8 @@ import os
 import json
 from instance_scheduler import configuration
 from datetime import datetime
+from instance_scheduler.schedulers.ec2_service import clear_ssm_windows_cache
+from instance_scheduler.schedulers.instance_scheduler import clear_role_credentials
 from instance_scheduler.util.logger import Logger
 from instance_scheduler.util.dynamodb_utils import DynamoDBUtils
 
@@ -99,6 +101,12 @@ class EventBusRequestHandler:
                     self._logger.info(
                         f"event details.operations doesn't match the scenarios configured. {detail}"
                     )
+                    return "Exiting event bus request handler"
+
+                # data cached for the account by warm scheduler invocations in this container is no longer valid
+                account = self._event.get("account")
+                clear_ssm_windows_cache(account)
+                clear_role_credentials(account)
             return "Exiting event bus request handler"
         except Exception as error:
             self._logger.error(error)
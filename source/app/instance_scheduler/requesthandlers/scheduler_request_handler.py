@@ -5,10 +5,10 @@
 
 import os
 from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from instance_scheduler import configuration
 from instance_scheduler import schedulers
-import pytz
 from instance_scheduler.configuration.scheduler_config_builder import (
     SchedulerConfigBuilder,
 )
@@ -20,10 +20,24 @@ INF_HANDLER = "Handler {} scheduling request for service(s) {}, account(s) {}, r
  time stamp is based on the default timezone selected for the solution."
 INF_SCHEDULER_RESULT = "Scheduler result {}"
 
-LOG_STREAM = "{}-{:0>4d}{:0>2d}{:0>2d}"
 LOG_STREAM_PREFIX = "Scheduler"
 
 
+def get_timezone(name):
+    """
+    Returns the tzinfo for a timezone name, zoneinfo caches these instances internally
+    :param name: name of the timezone
+    :return: timezone
+    """
+    try:
+        return ZoneInfo(name)
+    except ZoneInfoNotFoundError:
+        # names are validated against pytz, use it if the platform has no matching tz database entry
+        import pytz
+
+        return pytz.timezone(name)
+
+
 class SchedulerRequestHandler:
     """
     Class that handled the execution of the scheduler
@@ -33,6 +47,7 @@ class SchedulerRequestHandler:
         self._context = context
         self._event = event
         self._configuration = None
+        self._account_names = None
         self._logger = None
 
     @staticmethod
@@ -83,15 +98,15 @@ class SchedulerRequestHandler:
     @property
     def account_names(self):
         """
-        Iterates account names from the configuration
-        :return: account names to process
+        Gets the account names from the configuration
+        :return: list of account names to process
         """
-
-        if self.configuration.schedule_lambda_account:
-            yield self.lambda_account
-
-        for remote_account_id in self.configuration.remote_account_ids:
-            yield remote_account_id
+        if self._account_names is None:
+            cfg = self.configuration
+            names = [self.lambda_account] if cfg.schedule_lambda_account else []
+            names.extend(cfg.remote_account_ids)
+            self._account_names = names
+        return self._account_names
 
     def handle_request(self):
         """
@@ -100,52 +115,53 @@ class SchedulerRequestHandler:
         """
         result = {}
 
-        account_names = list(self.account_names)
-        for service in self.configuration.scheduled_services:
+        cfg = self.configuration
+        lambda_account = self.lambda_account
+        state_table = self.state_table
+        account_names = self.account_names
+        tz = get_timezone(cfg.default_timezone)
+        account_names_str = ", ".join(account_names)
+        regions_str = ", ".join(cfg.regions)
+        services_str = ", ".join(cfg.scheduled_services)
+        # log stream names only differ in the service name
+        stream_accounts = "-".join(account_names)
+        stream_regions = "-".join(cfg.regions)
+        dt = datetime.now(tz)
+        stream_date = f"{dt.year:04d}{dt.month:02d}{dt.day:02d}"
+
+        for service in cfg.scheduled_services:
             # gets the implementation that handles the actual scheduling for the service
             service_strategy = SCHEDULER_TYPES[service]()
             # create a scheduler and pass the service strategy
             scheduler = InstanceScheduler(
-                service=service_strategy, scheduler_configuration=self.configuration
+                service=service_strategy, scheduler_configuration=cfg
             )
 
             # setup logging for the service/account/region
-            s = "-".join(
-                [
-                    LOG_STREAM_PREFIX,
-                    service,
-                    "-".join(account_names),
-                    "-".join(self.configuration.regions),
-                ]
-            )
-
-            dt = datetime.now(pytz.timezone(self.configuration.default_timezone))
-            logstream = LOG_STREAM.format(s, dt.year, dt.month, dt.day)
+            logstream = f"{LOG_STREAM_PREFIX}-{service}-{stream_accounts}-{stream_regions}-{stream_date}"
             self._logger = Logger(
                 logstream=logstream,
-                buffersize=60 if self.configuration.trace else 30,
+                buffersize=60 if cfg.trace else 30,
                 context=self._context,
-                debug=self.configuration.trace,
+                debug=cfg.trace,
             )
 
             try:
                 self._logger.info(
                     INF_HANDLER.format(
                         self.__class__.__name__,
-                        ", ".join(self.configuration.scheduled_services),
-                        ", ".join(list(self.account_names)),
-                        ", ".join(list(self.configuration.regions)),
-                        datetime.now(
-                            pytz.timezone(self.configuration.default_timezone)
-                        ),
+                        services_str,
+                        account_names_str,
+                        regions_str,
+                        datetime.now(tz),
                     )
                 )
 
                 # run the scheduler for the service
                 result[service] = scheduler.run(
-                    state_table=self.state_table,
-                    scheduler_config=self.configuration,
-                    lambda_account=self.lambda_account,
+                    state_table=state_table,
+                    scheduler_config=cfg,
+                    lambda_account=lambda_account,
                     context=self._context,
                     logger=self._logger,
                 )
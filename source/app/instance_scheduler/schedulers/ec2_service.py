@@ -3,8 +3,9 @@
 # SPDX-License-Identifier: Apache-2.0
 
 
+import calendar
+import functools
 import os
-import boto3
 from datetime import timedelta, datetime
 import dateutil
 import jmespath
@@ -18,6 +19,7 @@ from instance_scheduler.boto_retry import get_client_with_standard_retry
 from instance_scheduler.configuration import SchedulerConfigBuilder
 from instance_scheduler.configuration.instance_schedule import InstanceSchedule
 from instance_scheduler.configuration.running_period import RunningPeriod
+from instance_scheduler.util.dynamodb_utils import DynamoDBUtils
 from boto3.dynamodb.conditions import Key
 
 # instances are started in batches, larger bathes are more efficient but smaller batches allow more instances
@@ -25,8 +27,20 @@ from boto3.dynamodb.conditions import Key
 
 ERR_RESIZING_INSTANCE_ = "Error resizing instance {}, ({})"
 
+# largest page size accepted by DescribeInstances
+DESCRIBE_INSTANCES_PAGE_SIZE = 1000
+
 START_BATCH_SIZE = 5
 STOP_BATCH_SIZE = 50
+# environment variables that override the default batch sizes
+ENV_START_EC2_BATCH_SIZE = "START_EC2_BATCH_SIZE"
+ENV_STOP_EC2_BATCH_SIZE = "STOP_EC2_BATCH_SIZE"
+
+# maintenance windows of an account and region are reused by warm Lambda invocations for this number of seconds
+SSM_WINDOWS_CACHE_TTL = 600
+
+# maintenance windows keyed by (account, region), holding the time they were loaded and the list of windows
+_ssm_windows_cache = {}
 
 ERR_STARTING_INSTANCES = "Error starting instances {}, ({})"
 ERR_STOPPING_INSTANCES = "Error stopping instances {}, ({})"
@@ -50,6 +64,7 @@ WARN_STARTED_INSTANCES_TAGGING = (
 WARN_STOPPED_INSTANCES_TAGGING = (
     "Error deleting or creating tags for stopped instances {} ({})"
 )
+WARN_INVALID_BATCH_SIZE = "Invalid value {} for {}, using default batch size {}"
 WARNING_INSTANCE_NOT_STARTING = "Ec2 instance {} is not started"
 WARNING_INSTANCE_NOT_STOPPING = "Ec2 instance {} is not stopped"
 WARN_NOT_HIBERNATED = (
@@ -65,6 +80,83 @@ DEBUG_SKIPPED_INSTANCE = (
 DEBUG_SELECTED_INSTANCE = "Selected ec2 instance {} in state ({})"
 
 
+# maintenance windows are the same for most runs, the parsed execution times are reused
+@functools.lru_cache(maxsize=1024)
+def _parse_execution_time(execution_time):
+    return dateutil.parser.parse(execution_time)
+
+
+# maintenance windows are the same for most runs, the periods built for a window are reused. The periods are built from
+# the local time of the window, so the start is passed as a naive local time (aware datetimes hash by their UTC time).
+@functools.lru_cache(maxsize=1024)
+def _maint_window_periods(name, start_dt, hours, interval):
+    start_before_begin = max(interval, 10)
+    begin_dt = start_dt - timedelta(minutes=start_before_begin)
+    end_dt = start_dt + timedelta(hours=hours)
+    if begin_dt.day == end_dt.day:
+        periods = (
+            RunningPeriod(
+                name="{}-period".format(name),
+                begintime=begin_dt.time(),
+                endtime=end_dt.time(),
+                monthdays={begin_dt.day},
+                months={begin_dt.month},
+            ),
+        )
+    elif end_dt - begin_dt <= timedelta(hours=24):
+        periods = (
+            RunningPeriod(
+                name="{}-period-1".format(name),
+                begintime=begin_dt.time(),
+                endtime=SchedulerConfigBuilder.get_time_from_string("23:59"),
+                monthdays={begin_dt.day},
+                months={begin_dt.month},
+            ),
+            RunningPeriod(
+                name="{}-period-2".format(name),
+                begintime=SchedulerConfigBuilder.get_time_from_string("00:00"),
+                endtime=end_dt.time(),
+                monthdays={end_dt.day},
+                months={end_dt.month},
+            ),
+        )
+    else:
+        periods = (
+            RunningPeriod(
+                name="{}-period-1".format(name),
+                begintime=begin_dt.time(),
+                endtime=SchedulerConfigBuilder.get_time_from_string("23:59"),
+                monthdays={begin_dt.day},
+                months={begin_dt.month},
+            ),
+            RunningPeriod(
+                name="{}-period-2".format(name),
+                monthdays={(end_dt - timedelta(days=1)).day},
+                months={(end_dt - timedelta(days=1)).month},
+            ),
+            RunningPeriod(
+                name="{}-period-3".format(name),
+                begintime=SchedulerConfigBuilder.get_time_from_string("00:00"),
+                endtime=end_dt.time(),
+                monthdays={end_dt.day},
+                months={end_dt.month},
+            ),
+        )
+
+    return begin_dt, end_dt, periods
+
+
+def clear_ssm_windows_cache(account=None):
+    """
+    Removes cached maintenance windows
+    :param account: account to remove the windows for, None to remove the windows of all accounts
+    :return:
+    """
+    for key in list(_ssm_windows_cache):
+        if account is None or key[0] == account:
+            _ssm_windows_cache.pop(key, None)
+
+
 class Ec2Service:
     """
     Implements service start/stop/resize functions for EC2 service
@@ -85,18 +177,29 @@ class Ec2Service:
     }
     EC2_STARTING_STATES = {EC2_STATE_PENDING, EC2_STATE_RUNNING}
 
-    def __init__(self):
+    def __init__(self, now=datetime.utcnow):
+        """
+        :param now: function returning the current (naive) UTC time
+        """
         self.service_name = "ec2"
+        self._now = now
         self.allow_resize = True
         self.schedules_with_hibernation = []
         self._ssm_maintenance_windows = None
         self._session = None
         self._logger = None
-        self._dynamodb = boto3.resource("dynamodb")
-        self._maintenance_table = self._dynamodb.Table(
+        self._maintenance_table = DynamoDBUtils.get_dynamodb_table_resource_ref(
             os.environ["MAINTENANCE_WINDOW_TABLE"]
         )
 
+    def clone(self):
+        """
+        Creates a new service instance with the same constructor arguments, the scheduler uses a clone for each region
+        it processes as the service keeps state for the region it is processing
+        :return: new service instance
+        """
+        return Ec2Service(now=self._now)
+
     def _init_scheduler(self, args):
         self._session = args.get(schedulers.PARAM_SESSION)
         self._context = args.get(schedulers.PARAM_CONTEXT)
@@ -105,6 +208,25 @@ class Ec2Service:
         self._account = args.get(schedulers.PARAM_ACCOUNT)
         self._tagname = args.get(schedulers.PARAM_TAG_NAME)
 
+    def batch_size(self, env_name, default):
+        """
+        Returns the number of instances that are started or stopped in a single call
+        :param env_name: name of the environment variable that can override the default size
+        :param default: default batch size
+        :return: batch size
+        """
+        value = os.getenv(env_name)
+        if value is None:
+            return default
+        try:
+            size = int(value)
+            if size > 0:
+                return size
+        except ValueError:
+            pass
+        self._logger.warning(WARN_INVALID_BATCH_SIZE, value, env_name, default)
+        return default
+
     @classmethod
     def instance_batches(cls, instances, size):
         instance_buffer = []
@@ -248,12 +370,15 @@ class Ec2Service:
                 )
                 window["ScheduleTimezone"] = "UTC"
 
-            tz = pytz.timezone(window["ScheduleTimezone"])
-            window_begin_time = execution_time.replace(tzinfo=tz)
-            window_end_time = execution_time.replace(tzinfo=tz) + timedelta(
-                hours=int(duration)
+            # the execution time is the local time in the timezone of the window, the window start and end and the
+            # current local time in that timezone are compared as integer seconds
+            window_begin_time = calendar.timegm(execution_time.timetuple())
+            window_end_time = window_begin_time + int(duration) * 3600
+            current_time = calendar.timegm(
+                pytz.utc.localize(self._now())
+                .astimezone(pytz.timezone(window["ScheduleTimezone"]))
+                .timetuple()
             )
-            current_time = datetime.now(tz).replace(tzinfo=tz)
             return window_begin_time < current_time < window_end_time
         except Exception as ex:
             self._logger.error("error in check_window_running {}".format(ex))
@@ -324,8 +449,17 @@ class Ec2Service:
 
     def get_ssm_windows(self, session, context, account, region):
         """
-        This function gets the list of the SSM maintenance windows
+        This function gets the list of the SSM maintenance windows, windows loaded less than SSM_WINDOWS_CACHE_TTL
+        seconds ago are returned from the cache
         """
+        now = self._now()
+        cached = _ssm_windows_cache.get((account, region))
+        if (
+            cached is not None
+            and (now - cached[0]).total_seconds() < SSM_WINDOWS_CACHE_TTL
+        ):
+            return cached[1]
+
         new_ssm_windows_list = []
         ssm_windows_service = self.get_ssm_windows_service(session, region)
         ssm_windows_db = self.get_ssm_windows_db(account, region)
@@ -339,6 +473,7 @@ class Ec2Service:
             self.remove_unused_windows(window_db, ssm_windows_service)
         for window in new_ssm_windows_list:
             ssm_windows_db.append(window)
+        _ssm_windows_cache[(account, region)] = (now, ssm_windows_db)
         return ssm_windows_db
 
     def ssm_maintenance_windows(self, session, context, account, region):
@@ -346,12 +481,15 @@ class Ec2Service:
             self._ssm_maintenance_windows = {}
             try:
                 window_list = self.get_ssm_windows(session, context, account, region)
+                # the scheduler interval is only read when there are windows to build periods for
+                scheduler_interval = (
+                    max(10, int(os.getenv(configuration.ENV_SCHEDULE_FREQUENCY)))
+                    if len(window_list) > 0
+                    else None
+                )
                 for window in window_list:
-                    start = dateutil.parser.parse(window["NextExecutionTime"])
+                    start = _parse_execution_time(window["NextExecutionTime"])
                     scheduler_timezone = window.get("ScheduleTimezone", "UTC")
-                    scheduler_interval = max(
-                        10, int(os.getenv(configuration.ENV_SCHEDULE_FREQUENCY))
-                    )
                     maintenance_schedule = self._schedule_from_maint_window(
                         name=window["Name"],
                         start=start,
@@ -411,7 +549,12 @@ class Ec2Service:
             + "|[?Tags]|[?contains(Tags[*].Key, '{}')]".format(tagname)
         )
 
-        args = {}
+        # only instances that have the schedule tag are returned, instances are selected by ec2 instead of listing
+        # all instances in the region, which also allows the largest page size
+        args = {
+            "Filters": [{"Name": "tag-key", "Values": [tagname]}],
+            "MaxResults": DESCRIBE_INSTANCES_PAGE_SIZE,
+        }
         number_of_instances = 0
         instances = []
         done = False
@@ -446,88 +589,26 @@ class Ec2Service:
         return instances
 
     def _schedule_from_maint_window(self, name, start, hours, interval, timezone):
-        start_dt = start.replace(second=0, microsecond=0)
-        start_before_begin = max(interval, 10)
-        begin_dt = start_dt - timedelta(minutes=start_before_begin)
-        end_dt = start_dt + timedelta(hours=hours)
-        if begin_dt.day == end_dt.day:
-            periods = [
-                {
-                    "period": RunningPeriod(
-                        name="{}-period".format(name),
-                        begintime=begin_dt.time(),
-                        endtime=end_dt.time(),
-                        monthdays={begin_dt.day},
-                        months={begin_dt.month},
-                    ),
-                    "instancetype": None,
-                }
-            ]
-        elif end_dt - begin_dt <= timedelta(hours=24):
-            periods = [
-                {
-                    "period": RunningPeriod(
-                        name="{}-period-1".format(name),
-                        begintime=begin_dt.time(),
-                        endtime=SchedulerConfigBuilder.get_time_from_string("23:59"),
-                        monthdays={begin_dt.day},
-                        months={begin_dt.month},
-                    ),
-                    "instancetype": None,
-                },
-                {
-                    "period": RunningPeriod(
-                        name="{}-period-2".format(name),
-                        begintime=SchedulerConfigBuilder.get_time_from_string("00:00"),
-                        endtime=end_dt.time(),
-                        monthdays={end_dt.day},
-                        months={end_dt.month},
-                    ),
-                    "instancetype": None,
-                },
-            ]
-        else:
-            periods = [
-                {
-                    "period": RunningPeriod(
-                        name="{}-period-1".format(name),
-                        begintime=begin_dt.time(),
-                        endtime=SchedulerConfigBuilder.get_time_from_string("23:59"),
-                        monthdays={begin_dt.day},
-                        months={begin_dt.month},
-                    ),
-                    "instancetype": None,
-                },
-                {
-                    "period": RunningPeriod(
-                        name="{}-period-2".format(name),
-                        monthdays={(end_dt - timedelta(days=1)).day},
-                        months={(end_dt - timedelta(days=1)).month},
-                    ),
-                    "instancetype": None,
-                },
-                {
-                    "period": RunningPeriod(
-                        name="{}-period-3".format(name),
-                        begintime=SchedulerConfigBuilder.get_time_from_string("00:00"),
-                        endtime=end_dt.time(),
-                        monthdays={end_dt.day},
-                        months={end_dt.month},
-                    ),
-                    "instancetype": None,
-                },
-            ]
+        begin_dt, end_dt, periods = _maint_window_periods(
+            name,
+            start.replace(second=0, microsecond=0, tzinfo=None),
+            hours,
+            interval,
+        )
 
         schedule = InstanceSchedule(
             name=name,
             timezone=timezone,
             description="{} maintenance window".format(name),
             enforced=True,
-            periods=periods,
+            periods=[{"period": p, "instancetype": None} for p in periods],
         )
 
         self._logger.info(
-            INF_MAINT_WINDOW, name, begin_dt.isoformat(), end_dt.isoformat()
+            INF_MAINT_WINDOW,
+            name,
+            begin_dt.replace(tzinfo=start.tzinfo).isoformat(),
+            end_dt.replace(tzinfo=start.tzinfo).isoformat(),
         )
 
         return schedule
@@ -621,9 +702,11 @@ class Ec2Service:
         def is_in_stopping_state(state):
             return (state & 0xFF) in Ec2Service.EC2_STOPPING_STATES
 
-        self._init_scheduler(kwargs)
-
         stopped_instances = kwargs[schedulers.PARAM_STOPPED_INSTANCES]
+        if len(stopped_instances) == 0:
+            return
+
+        self._init_scheduler(kwargs)
         stop_tags = kwargs[schedulers.PARAM_CONFIG].stopped_tags
         if stop_tags is None:
             stop_tags = []
@@ -640,8 +723,8 @@ class Ec2Service:
             "ec2", session=self._session, region=self._region
         )
 
-        for instance_batch in list(
-            self.instance_batches(stopped_instances, STOP_BATCH_SIZE)
+        for instance_batch in self.instance_batches(
+            stopped_instances, self.batch_size(ENV_STOP_EC2_BATCH_SIZE, STOP_BATCH_SIZE)
         ):
             instance_ids = [i.id for i in instance_batch]
 
@@ -710,7 +793,8 @@ class Ec2Service:
                             ERR_STOPPING_INSTANCES, ",".join(not_hibernated), str(ex)
                         )
 
-                get_status_count = 0
+                # re-check the state of instances that were not reported as stopping, the instances of a batch that
+                # did change state must still be tagged and returned, and the remaining batches must still be processed
                 if len(instances_stopping) < len(instance_ids):
                     time.sleep(5)
 
@@ -720,15 +804,9 @@ class Ec2Service:
                         if is_in_stopping_state(i.get("State", {}).get("Code", ""))
                     ]
 
-                    if len(instances_stopping) == len(instance_ids):
-                        break
-
-                    get_status_count += 1
-                    if get_status_count > 3:
-                        for i in instance_ids:
-                            if i not in instances_stopping:
-                                self._logger.warning(WARNING_INSTANCE_NOT_STOPPING, i)
-                        break
+                    for i in instance_ids:
+                        if i not in instances_stopping:
+                            self._logger.warning(WARNING_INSTANCE_NOT_STOPPING, i)
 
                 if len(instances_stopping) > 0:
                     try:
@@ -774,9 +852,11 @@ class Ec2Service:
         def is_in_starting_state(state):
             return (state & 0xFF) in Ec2Service.EC2_STARTING_STATES
 
-        self._init_scheduler(kwargs)
-
         instances_to_start = kwargs[schedulers.PARAM_STARTED_INSTANCES]
+        if len(instances_to_start) == 0:
+            return
+
+        self._init_scheduler(kwargs)
         start_tags = kwargs[schedulers.PARAM_CONFIG].started_tags
         if start_tags is None:
             start_tags = []
@@ -790,16 +870,11 @@ class Ec2Service:
             "ec2", session=self._session, region=self._region
         )
 
-        if os.environ["START_EC2_BATCH_SIZE"] is not None:
-            try:
-                START_BATCH_SIZE = int(os.environ["START_EC2_BATCH_SIZE"])
-            except Exception as ex:
-                self._logger.info(ex)
-
         for instance_batch in self.instance_batches(
-            instances_to_start, START_BATCH_SIZE
+            instances_to_start,
+            self.batch_size(ENV_START_EC2_BATCH_SIZE, START_BATCH_SIZE),
         ):
-            instance_ids = [i.id for i in list(instance_batch)]
+            instance_ids = [i.id for i in instance_batch]
             try:
                 start_resp = client.start_instances(InstanceIds=instance_ids)
                 instances_starting = [
@@ -808,7 +883,8 @@ class Ec2Service:
                     if is_in_starting_state(i.get("CurrentState", {}).get("Code", ""))
                 ]
 
-                get_status_count = 0
+                # re-check the state of instances that were not reported as starting, the instances of a batch that
+                # did change state must still be tagged and returned, and the remaining batches must still be processed
                 if len(instances_starting) < len(instance_ids):
                     time.sleep(5)
 
@@ -818,15 +894,9 @@ class Ec2Service:
                         if is_in_starting_state(i.get("State", {}).get("Code", ""))
                     ]
 
-                    if len(instances_starting) == len(instance_ids):
-                        break
-
-                    get_status_count += 1
-                    if get_status_count > 3:
-                        for i in instance_ids:
-                            if i not in instances_starting:
-                                self._logger.warning(WARNING_INSTANCE_NOT_STARTING, i)
-                        break
+                    for i in instance_ids:
+                        if i not in instances_starting:
+                            self._logger.warning(WARNING_INSTANCE_NOT_STARTING, i)
 
                 if len(instances_starting) > 0:
                     try:
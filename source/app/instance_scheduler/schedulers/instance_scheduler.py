@@ -6,15 +6,18 @@
 from __future__ import print_function
 
 import os
-from datetime import datetime
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import islice
 
 import boto3
 import json
-import pytz
 from botocore.exceptions import ClientError
 from instance_scheduler import configuration
 from instance_scheduler import schedulers
 from instance_scheduler.boto_retry import (
+    default_session,
     get_client_with_standard_retry,
     standard_retries_client_config,
 )
@@ -25,12 +28,19 @@ from instance_scheduler.util.named_tuple_builder import as_namedtuple
 from instance_scheduler.util.scheduler_metrics import SchedulerMetrics
 
 ERR_ASSUMING_ROLE = "Can not assume role {} for account {}, ({}))"
+ERR_ASSUMING_ROLE_CODE = "Error Code {}"
 ERR_INVALID_ARN = "{} is not a valid ARN"
 ERR_INVALID_REGION = "{} is not a valid region name"
+ERR_INVOKING_LAMBDA = "Error invoking lambda {} error {}"
+ERR_REMOVING_ACCOUNT_NO_ROLE_PERMISSION = (
+    "Removing the account {} from scheduling configuration as assume role permission is missing for the "
+    "iam role {}"
+)
 ERR_SETTING_INSTANCE_TYPE = "Error changing instance type ({})"
 
 INF_DESIRED_TYPE = ", desired type is {}"
 INF_PROCESSING_ACCOUNT = "Running {} scheduler for account {}{} in region(s) {}"
+INF_REMOVING_ACCOUNT = "Removing account {} from configuration"
 INF_STARTING_INSTANCES = "Starting instances {} in region {}"
 INF_STOPPED_INSTANCES = "Stopping instances {} in region {}"
 INF_MAINTENANCE_WINDOW = (
@@ -48,6 +58,24 @@ WARN_SKIPPING_UNKNOWN_SCHEDULE = (
 )
 WARN_RESIZE_NOT_SUPPORTED = "Instance {} with type {} does not support resizing"
 
+# maximum number of account/region combinations that are processed concurrently, bounded to stay within AWS API
+# rate limits
+MAX_WORKERS = 16
+
+# duration of assumed cross account role sessions, credentials are reused until they are about to expire
+ROLE_SESSION_DURATION = 3600
+ROLE_CREDENTIALS_EXPIRY_MARGIN = timedelta(minutes=5)
+
+# maximum number of instances listed by name in the messages for starting and stopping instances
+LOG_MAX_INSTANCES = 50
+
+# credentials for assumed cross account roles, keyed by role arn and session name, kept at module level so warm Lambda
+# invocations reuse them
+_role_credentials = {}
+
+DEBUG_REMOVE_ACCOUNT_RESPONSE = (
+    "Lambda response {} for removing account from configuration"
+)
 DEBUG_STOPPED_REGION_INSTANCES = (
     "Listing instance {} in region {} to be stopped by scheduler"
 )
@@ -59,7 +87,7 @@ DEBUG_CURRENT_INSTANCE_STATE = (
     'Current state is {}, instance type is {}, schedule is "{}"'
 )
 DEBUG_SKIPPING_TERMINATED_INSTANCE = (
-    'Skipping terminated instance "{}" in region {} for account {}'
+    'Skipping terminated instance "{}:{}" in region {} for account {}'
 )
 DEBUG_STARTED_REGION_INSTANCES = (
     "Listing instance {} in region {} with instance type {} to be started by scheduler"
@@ -75,6 +103,59 @@ DEBUG_APPLY_RETAIN_RUNNING_STATE = (
     "this running period"
 )
 
+# terminated instances returned by a service, only the id is needed to delete the state of these instances
+TerminatedInstance = namedtuple(
+    "TerminatedInstance", ["id", "account", "is_terminated"], defaults=[True]
+)
+
+
+class _RegionContext:
+    """
+    State for processing the instances of a service in a region of an account. Each region is processed with its own
+    context, service strategy and instance state store, so regions can be processed concurrently
+    """
+
+    def __init__(self, account, region, service, instance_states, params):
+        """
+        Initializes the context for processing a region
+        :param account: account the region is processed for
+        :param region: name of the region
+        :param service: service strategy that is only used for this region
+        :param instance_states: store for the last desired states of the instances in the region
+        :param params: parameters for the calls to the service strategy that are the same for all instances in the region
+        """
+        self.account = account
+        self.region = region
+        self.service = service
+        self.instance_states = instance_states
+        self.params = params
+        self.start_list = []
+        self.stop_list = []
+        self.resize_list = []
+
+
+def _instances_str(instances):
+    """
+    Builds the list of instances for the log messages for starting and stopping instances, long lists are truncated
+    :param instances: instances to list
+    :return: comma separated names of the instances
+    """
+    s = ", ".join(i.instance_str for i in islice(instances, LOG_MAX_INSTANCES))
+    if len(instances) > LOG_MAX_INSTANCES:
+        s += " (+{} more)".format(len(instances) - LOG_MAX_INSTANCES)
+    return s
+
+
+def clear_role_credentials(account=None):
+    """
+    Removes cached credentials of assumed cross account roles
+    :param account: account to remove the credentials for, None to remove the credentials for all accounts
+    :return:
+    """
+    for role_arn, session_name in list(_role_credentials):
+        if account is None or schedulers.account_from_role(role_arn) == account:
+            _role_credentials.pop((role_arn, session_name), None)
+
 
 class InstanceScheduler:
     """
@@ -87,22 +168,29 @@ class InstanceScheduler:
         :param service: service strategy that handles the actual listing, starting and stopping of the instances of that service
         """
         self._service = service
-        self._instance_states = None
+        # the service name is used for every instance processed, resolve it once
+        self._service_name = service.service_name
+        self._service_name_upper = self._service_name.upper()
         self._schedule_metrics = None
         self._sts_client = None
         self._scheduled_instances = []
         self._configuration = None
-        self._scheduler_start_list = []
-        self._scheduler_stop_list = []
-        self._schedule_resize_list = []
         self._scheduler_configuration = scheduler_configuration
         self._stack_name = os.getenv(configuration.ENV_STACK, "")
         self._lambda_account = os.getenv(configuration.ENV_ACCOUNT)
         self._logger = None
         self._context = None
         self._lambda_client = None
-
-        self._usage_metrics = {"Started": {}, "Stopped": {}, "Resized": {}}
+        self._lambda_region = None
+        self._run_time_utc = None
+        self._send_metrics = False
+        self._state_table = None
+
+        self._usage_metrics = {
+            "Started": defaultdict(int),
+            "Stopped": defaultdict(int),
+            "Resized": defaultdict(int),
+        }
 
     @property
     def lambda_client(self):
@@ -120,15 +208,15 @@ class InstanceScheduler:
             return self._configuration.regions
         else:
             # no regions, use region of lambda function
-            return [boto3.Session().region_name]
+            if self._lambda_region is None:
+                self._lambda_region = default_session().region_name
+            return [self._lambda_region]
 
     @property
     def _sts(self):
         if self._sts_client is None:
-            session = boto3.Session()
-            sts_regional_endpoint = str.format(
-                "https://sts.{}.amazonaws.com", session.region_name
-            )
+            session = default_session()
+            sts_regional_endpoint = f"https://sts.{session.region_name}.amazonaws.com"
             self._sts_client = session.client(
                 "sts",
                 region_name=session.region_name,
@@ -154,9 +242,7 @@ class InstanceScheduler:
         """
         try:
             self._logger.error(
-                "Removing the account {} from scheduling configuration as assume role permission is missing for the iam role {}".format(
-                    aws_account, cross_account_role
-                )
+                ERR_REMOVING_ACCOUNT_NO_ROLE_PERMISSION, aws_account, cross_account_role
             )
             payload = str.encode(
                 json.dumps(
@@ -173,34 +259,45 @@ class InstanceScheduler:
                 LogType="None",
                 Payload=payload,
             )
-            self._logger.info(
-                "Removing account {} from configuration".format(aws_account)
-            )
-            self._logger.debug(
-                "Lambda response {} for removing account from configuration".format(
-                    response
-                )
-            )
+            self._logger.info(INF_REMOVING_ACCOUNT, aws_account)
+            self._logger.debug(DEBUG_REMOVE_ACCOUNT_RESPONSE, response)
         except Exception as ex:
             self._logger.error(
-                "Error invoking lambda {} error {}".format(
-                    self._context.function_name, ex
-                )
+                ERR_INVOKING_LAMBDA, self._context.function_name, str(ex)
             )
 
+    def _get_role_credentials(self, role_arn, session_name):
+        """
+        Returns credentials for a cross account role, credentials of a previous assume role call are reused as long as
+        they are not about to expire
+        :param role_arn: arn of the role to assume
+        :param session_name: name of the role session
+        :return: credentials for the role
+        """
+        credentials = _role_credentials.get((role_arn, session_name))
+        if (
+            credentials is None
+            or credentials["Expiration"] - datetime.now(timezone.utc)
+            < ROLE_CREDENTIALS_EXPIRY_MARGIN
+        ):
+            token = self._sts.assume_role(
+                RoleArn=role_arn,
+                RoleSessionName=session_name,
+                DurationSeconds=ROLE_SESSION_DURATION,
+            )
+            credentials = token["Credentials"]
+            _role_credentials[(role_arn, session_name)] = credentials
+        return credentials
+
     @property
     def _accounts(self):
         def get_session_for_account(cross_account_role, aws_account):
             # get a token for the cross account role and use it to create a session
             try:
-                session_name = "{}-scheduler-{}".format(
-                    self._service.service_name, aws_account
+                session_name = f"{self._service_name}-scheduler-{aws_account}"
+                credentials = self._get_role_credentials(
+                    cross_account_role, session_name
                 )
-                # assume a role
-                token = self._sts.assume_role(
-                    RoleArn=cross_account_role, RoleSessionName=session_name
-                )
-                credentials = token["Credentials"]
                 # create a session using the assumed role credentials
                 return boto3.Session(
                     aws_access_key_id=credentials["AccessKeyId"],
@@ -209,7 +306,7 @@ class InstanceScheduler:
                 )
             except ClientError as ex:
                 self._logger.error(
-                    "Error Code {}".format(ex.response.get("Error", {}).get("Code"))
+                    ERR_ASSUMING_ROLE_CODE, ex.response.get("Error", {}).get("Code")
                 )
                 if ex.response.get("Error", {}).get("Code") == "AccessDenied":
                     self.remove_account_from_config(
@@ -217,9 +314,7 @@ class InstanceScheduler:
                     )
                 else:
                     self._logger.error(
-                        ERR_ASSUMING_ROLE.format(
-                            cross_account_role, aws_account, str(ex)
-                        )
+                        ERR_ASSUMING_ROLE, cross_account_role, aws_account, str(ex)
                     )
                     return None
 
@@ -232,12 +327,18 @@ class InstanceScheduler:
             yield as_namedtuple(
                 "Account",
                 {
-                    "session": boto3.Session(),
+                    "session": default_session(),
                     "name": self._lambda_account,
                     "role": None,
                 },
             )
 
+        # only the account differs between the roles assumed in the remote accounts
+        role_template = (
+            f"arn:{self._configuration.aws_partition}:iam::{{}}:role/"
+            f"{self._configuration.namespace}-{self._configuration.scheduler_role_name}"
+        )
+
         # iterate through remote accounts
         for account in self._configuration.remote_account_ids:
             if account in accounts_done:
@@ -245,7 +346,7 @@ class InstanceScheduler:
                 continue
 
             # get a session for the role
-            role = f"arn:{self._configuration.aws_partition}:iam::{account}:role/{self._configuration.namespace}-{self._configuration.scheduler_role_name}"
+            role = role_template.format(account)
             session = get_session_for_account(role, account)
             if session is not None:
                 yield as_namedtuple(
@@ -253,33 +354,28 @@ class InstanceScheduler:
                 )
 
     def _instance_display_str(self, inst_id, name):
-        s = "{}:{}".format(self._service.service_name.upper(), inst_id)
         if name:
-            s += " ({})".format(name)
-        return s
+            return f"{self._service_name_upper}:{inst_id} ({name})"
+        return f"{self._service_name_upper}:{inst_id}"
 
-    def _scheduled_instances_in_region(self, account, region):
+    def _scheduled_instances_in_region(self, ctx):
+        tuple_name = self._service_name + "Instance"
         # use service strategy to get a list of instances that can be scheduled for that service
-        for instance in self._service.get_schedulable_instances(
-            {
-                schedulers.PARAM_SESSION: account.session,
-                schedulers.PARAM_ACCOUNT: account.name,
-                schedulers.PARAM_ROLE: account.role,
-                schedulers.PARAM_REGION: region,
-                schedulers.PARAM_CONFIG: self._configuration,
-                schedulers.PARAM_LOGGER: self._logger,
-                schedulers.PARAM_CONTEXT: self._context,
-            }
+        for instance in ctx.service.get_schedulable_instances(
+            {**ctx.params, schedulers.PARAM_CONFIG: self._configuration}
         ):
-            instance["account"] = account.name
-            instance["region"] = region
-            instance["service"] = self._service.service_name
+            if instance[schedulers.INST_IS_TERMINATED]:
+                # the state of terminated instances is deleted, there is no need to build the full instance for them
+                yield TerminatedInstance(instance[schedulers.INST_ID], ctx.account.name)
+                continue
+
+            instance["account"] = ctx.account.name
+            instance["region"] = ctx.region
+            instance["service"] = self._service_name
             instance["instance_str"] = self._instance_display_str(
                 instance["id"], instance["name"]
             )
-            inst = as_namedtuple(
-                self._service.service_name + "Instance", instance, excludes=["tags"]
-            )
+            inst = as_namedtuple(tuple_name, instance, excludes=["tags"])
             yield inst
 
     def run(
@@ -299,12 +395,14 @@ class InstanceScheduler:
         self._configuration = scheduler_config
         self._logger = logger
         self._context = context
+        self._state_table = state_table
         self._logger.debug_enabled = self._configuration.trace
 
-        # stored instance desired states
-        self._instance_states = InstanceStates(
-            state_table, self._service.service_name, self._logger, self._context
-        )
+        # sending anonymous usage metrics is a deployment setting that does not change during a run
+        self._send_metrics = allow_send_metrics()
+
+        # time at which instances are evaluated against maintenance windows in this run
+        self._run_time_utc = datetime.now(timezone.utc)
 
         # time to use for metrics
         self._schedule_metrics = SchedulerMetrics(datetime.utcnow(), self._context)
@@ -312,15 +410,71 @@ class InstanceScheduler:
         # response to caller, contains list off all processed accounts with started and stopped instances
         response = {}
 
-        for account in self._accounts:
-            response[account.name] = self._process_account(account)
+        accounts = list(self._accounts)
+        regions = self._regions
+
+        for account in accounts:
+            self._logger.info(
+                INF_PROCESSING_ACCOUNT,
+                self._service_name_upper,
+                account.name,
+                " using role " + account.role if account.role else "",
+                ", ".join(self._configuration.regions),
+            )
+            response[account.name] = {"started": {}, "stopped": {}}
+            if self._service.allow_resize:
+                response[account.name]["resized"] = {}
+
+        tasks = [(account, region) for account in accounts for region in regions]
+        contexts = []
+        if len(tasks) == 1:
+            # a single account and region, the usual case as a Lambda is invoked per account and region, is processed on
+            # this thread so the resources cached for it are reused by warm invocations
+            contexts.append(self._process_region(*tasks[0]))
+        elif len(tasks) > 1:
+            # accounts and regions are independent, each combination is processed in a separate thread
+            with ThreadPoolExecutor(
+                max_workers=min(len(tasks), MAX_WORKERS)
+            ) as executor:
+                futures = [
+                    executor.submit(self._process_region, account, region)
+                    for account, region in tasks
+                ]
+                contexts = [future.result() for future in futures]
+
+        for ctx in contexts:
+            # build output structure, hold started, stopped and resized instances per region
+            result = response[ctx.account.name]
+            if len(ctx.start_list) > 0:
+                result["started"][ctx.region] = {
+                    i.id: {"schedule": i.schedule_name} for i in ctx.start_list
+                }
+            if len(ctx.stop_list) > 0:
+                result["stopped"][ctx.region] = {
+                    i.id: {"schedule": i.schedule_name} for i in ctx.stop_list
+                }
+            if len(ctx.resize_list) > 0 and "resized" in result:
+                result["resized"][ctx.region] = {
+                    i[0].id: {
+                        "schedule": i[0].schedule_name,
+                        "old": i[0].instancetype,
+                        "new": i[1],
+                    }
+                    for i in ctx.resize_list
+                }
+            if self._send_metrics:
+                self._collect_usage_metrics(ctx)
 
-        if allow_send_metrics():
+        # put cloudwatch metrics
+        if self._configuration.use_metrics:
+            self._schedule_metrics.put_schedule_metrics()
+
+        if self._send_metrics:
             self._send_usage_metrics()
 
         return response
 
-    def get_desired_state_and_type(self, schedule, instance):
+    def get_desired_state_and_type(self, schedule, instance, now=None):
         # test if the instance has a maintenance window in which it must be running
         if (
             instance.maintenance_window is not None
@@ -330,7 +484,13 @@ class InstanceScheduler:
                 INF_MAINTENANCE_WINDOW, instance.maintenance_window.name, instance.id
             )
 
-            # get the desired start for the maintenance window at current UTC time
+            # get the desired start for the maintenance window at the UTC time of this run
+            if now is None:
+                now = (
+                    self._run_time_utc
+                    if self._run_time_utc is not None
+                    else datetime.now(timezone.utc)
+                )
             (
                 inst_state,
                 inst_type,
@@ -338,7 +498,7 @@ class InstanceScheduler:
             ) = instance.maintenance_window.get_desired_state(
                 instance,
                 logger=self._logger,
-                dt=datetime.utcnow().replace(tzinfo=pytz.timezone("UTC")),
+                dt=now,
             )
 
             # if we're in the maintenance window return running state
@@ -351,436 +511,430 @@ class InstanceScheduler:
         )
         return inst_state, inst_type
 
-    def _process_account(self, account):
-        # processes instances for a service in an account
-        started_instances = {}
-        stopped_instances = {}
-        resized_instances = {}
-
-        self._logger.info(
-            INF_PROCESSING_ACCOUNT,
-            self._service.service_name.upper(),
-            account.name,
-            " using role " + account.role if account.role else "",
-            ", ".join(self._configuration.regions),
+    def _process_region(self, account, region):
+        # processes instances for a service in a region of an account, all state for the region is kept in its context
+        ctx = _RegionContext(
+            account=account,
+            region=region,
+            service=self._service.clone(),
+            instance_states=InstanceStates(
+                self._state_table, self._service_name, self._logger, self._context
+            ),
+            # parameters for the calls to the service strategy that are the same for all instances in the region
+            params={
+                schedulers.PARAM_SESSION: account.session,
+                schedulers.PARAM_ACCOUNT: account.name,
+                schedulers.PARAM_ROLE: account.role,
+                schedulers.PARAM_REGION: region,
+                schedulers.PARAM_LOGGER: self._logger,
+                schedulers.PARAM_CONTEXT: self._context,
+            },
         )
 
-        for region in self._regions:
-            state_loaded = False
-            instances = []
-
-            self._scheduler_start_list = []
-            self._scheduler_stop_list = []
-            self._schedule_resize_list = []
+        state_loaded = False
+        # only the ids are kept to clean up the states of instances that no longer exist
+        instance_ids = []
 
-            for instance in self._scheduled_instances_in_region(account, region):
-                # delay loading instance state until first instance is returned
-                if not state_loaded:
-                    self._instance_states.load(account.name, region)
-                    state_loaded = True
-
-                instances.append(instance)
-
-                # handle terminated instances
-                if instance.is_terminated:
-                    self._logger.debug(
-                        DEBUG_SKIPPING_TERMINATED_INSTANCE,
-                        instance.instance_str,
-                        region,
-                        instance.account,
-                    )
-                    self._instance_states.delete_instance_state(instance.id)
-                    continue
+        for instance in self._scheduled_instances_in_region(ctx):
+            # delay loading instance state until first instance is returned
+            if not state_loaded:
+                ctx.instance_states.load(account.name, region)
+                state_loaded = True
 
-                # get the schedule for this instance
-                instance_schedule = self._configuration.get_schedule(
-                    instance.schedule_name
-                )
-                if not instance_schedule:
-                    self._logger.warning(
-                        WARN_SKIPPING_UNKNOWN_SCHEDULE,
-                        instance.instance_str,
-                        region,
-                        instance.account,
-                        instance.schedule_name,
-                    )
-                    continue
+            instance_ids.append(instance.id)
 
-                self._logger.debug(DEBUG_INSTANCE_HEADER, instance.instance_str)
+            # handle terminated instances
+            if instance.is_terminated:
                 self._logger.debug(
-                    DEBUG_CURRENT_INSTANCE_STATE,
-                    instance.current_state,
-                    instance.instancetype,
-                    instance_schedule.name,
+                    DEBUG_SKIPPING_TERMINATED_INSTANCE,
+                    self._service_name_upper,
+                    instance.id,
+                    region,
+                    instance.account,
                 )
+                ctx.instance_states.delete_instance_state(instance.id)
+                continue
 
-                # based on the schedule get the desired state and instance type for this instance
-                desired_state, desired_type = self.get_desired_state_and_type(
-                    instance_schedule, instance
+            # get the schedule for this instance
+            instance_schedule = self._configuration.get_schedule(instance.schedule_name)
+            if not instance_schedule:
+                self._logger.warning(
+                    WARN_SKIPPING_UNKNOWN_SCHEDULE,
+                    instance.instance_str,
+                    region,
+                    instance.account,
+                    instance.schedule_name,
                 )
+                continue
 
-                # get the  previous desired instance state
-                last_desired_state = self._instance_states.get_instance_state(
-                    instance.id
-                )
-                self._logger.debug(
-                    DEBUG_CURRENT_AND_DESIRED_STATE,
-                    instance_schedule.name,
+            self._logger.debug(DEBUG_INSTANCE_HEADER, instance.instance_str)
+            self._logger.debug(
+                DEBUG_CURRENT_INSTANCE_STATE,
+                instance.current_state,
+                instance.instancetype,
+                instance_schedule.name,
+            )
+
+            # based on the schedule get the desired state and instance type for this instance
+            desired_state, desired_type = self.get_desired_state_and_type(
+                instance_schedule, instance
+            )
+
+            # get the  previous desired instance state
+            last_desired_state = ctx.instance_states.get_instance_state(instance.id)
+            self._logger.debug(
+                DEBUG_CURRENT_AND_DESIRED_STATE,
+                instance_schedule.name,
+                desired_state,
+                last_desired_state,
+                instance.current_state,
+                INF_DESIRED_TYPE.format(desired_type) if desired_type else "",
+            )
+
+            # last desired state None means this is the first time the instance is seen by the scheduler
+            if last_desired_state is InstanceSchedule.STATE_UNKNOWN:
+                # new instances that are running are optionally not stopped to allow them to finish possible initialization
+                if (
+                    instance.is_running
+                    and desired_state == InstanceSchedule.STATE_STOPPED
+                    and not instance_schedule.stop_new_instances
+                ):
+                    ctx.instance_states.set_instance_state(
+                        instance.id, InstanceSchedule.STATE_STOPPED
+                    )
+                    self._logger.debug(DEBUG_NEW_INSTANCE, instance.instance_str)
+                    continue
+                self._process_new_desired_state(
+                    ctx,
+                    instance,
                     desired_state,
+                    desired_type,
                     last_desired_state,
-                    instance.current_state,
-                    INF_DESIRED_TYPE.format(desired_type) if desired_type else "",
+                    instance_schedule.retain_running,
                 )
 
-                # last desired state None means this is the first time the instance is seen by the scheduler
-                if last_desired_state is InstanceSchedule.STATE_UNKNOWN:
-                    # new instances that are running are optionally not stopped to allow them to finish possible initialization
-                    if (
-                        instance.is_running
-                        and desired_state == InstanceSchedule.STATE_STOPPED
-                    ):
-                        if not instance_schedule.stop_new_instances:
-                            self._instance_states.set_instance_state(
-                                instance.id, InstanceSchedule.STATE_STOPPED
-                            )
-                            self._logger.debug(
-                                DEBUG_NEW_INSTANCE, instance.instance_str
-                            )
-                            continue
-                        self._process_new_desired_state(
-                            account,
-                            region,
-                            instance,
-                            desired_state,
-                            desired_type,
-                            last_desired_state,
-                            instance_schedule.retain_running,
-                        )
-                    else:
-                        self._process_new_desired_state(
-                            account,
-                            region,
-                            instance,
-                            desired_state,
-                            desired_type,
-                            last_desired_state,
-                            instance_schedule.retain_running,
-                        )
-
-                # existing instance
-
-                # if enforced check the actual state with the desired state enforcing the schedule state
-                elif instance_schedule.enforced:
-                    if (
-                        instance.is_running
-                        and desired_state == InstanceSchedule.STATE_STOPPED
-                    ) or (
-                        not instance.is_running
-                        and desired_state == InstanceSchedule.STATE_RUNNING
-                    ):
-                        self._logger.debug(
-                            DEBUG_ENFORCED_STATE,
-                            instance.instance_str,
-                            InstanceSchedule.STATE_RUNNING
-                            if instance.is_running
-                            else InstanceSchedule.STATE_STOPPED,
-                            desired_state,
-                        )
-                        self._process_new_desired_state(
-                            account,
-                            region,
-                            instance,
-                            desired_state,
-                            desired_type,
-                            last_desired_state,
-                            instance_schedule.retain_running,
-                        )
-                # if not enforced then compare the schedule state with the actual state so state of manually started/stopped
-                # instance it will honor that state
-                elif last_desired_state != desired_state:
+            # existing instance
+
+            # if enforced check the actual state with the desired state enforcing the schedule state
+            elif instance_schedule.enforced:
+                if (
+                    instance.is_running
+                    and desired_state == InstanceSchedule.STATE_STOPPED
+                ) or (
+                    not instance.is_running
+                    and desired_state == InstanceSchedule.STATE_RUNNING
+                ):
+                    self._logger.debug(
+                        DEBUG_ENFORCED_STATE,
+                        instance.instance_str,
+                        InstanceSchedule.STATE_RUNNING
+                        if instance.is_running
+                        else InstanceSchedule.STATE_STOPPED,
+                        desired_state,
+                    )
                     self._process_new_desired_state(
-                        account,
-                        region,
+                        ctx,
                         instance,
                         desired_state,
                         desired_type,
                         last_desired_state,
                         instance_schedule.retain_running,
                     )
-
-                self._schedule_metrics.add_schedule_metrics(
-                    self._service.service_name, instance_schedule, instance
+            # if not enforced then compare the schedule state with the actual state so state of manually started/stopped
+            # instance it will honor that state
+            elif last_desired_state != desired_state:
+                self._process_new_desired_state(
+                    ctx,
+                    instance,
+                    desired_state,
+                    desired_type,
+                    last_desired_state,
+                    instance_schedule.retain_running,
                 )
 
-            # process lists of instances that must be started or stopped
-            self._start_and_stop_instances(account, region=region)
+            self._schedule_metrics.add_schedule_metrics(
+                self._service_name, instance_schedule, instance
+            )
 
-            # cleanup desired instance states and save
-            self._instance_states.cleanup([i.id for i in instances])
-            self._instance_states.save()
+        # process lists of instances that must be started or stopped
+        self._start_and_stop_instances(ctx)
 
-            # build output structure, hold started, stopped and resized instances per region
-            if len(self._scheduler_start_list) > 0:
-                started_instances[region] = [
-                    {i.id: {"schedule": i.schedule_name}}
-                    for i in self._scheduler_start_list
-                ]
-            if len(self._scheduler_stop_list):
-                stopped_instances[region] = [
-                    {i.id: {"schedule": i.schedule_name}}
-                    for i in self._scheduler_stop_list
-                ]
-            if len(self._schedule_resize_list) > 0:
-                resized_instances[region] = [
-                    {
-                        i[0].id: {
-                            "schedule": i[0].schedule_name,
-                            "old": i[0].instancetype,
-                            "new": i[1],
-                        }
-                    }
-                    for i in self._schedule_resize_list
-                ]
-            if allow_send_metrics():
-                self._collect_usage_metrics()
-
-        # put cloudwatch metrics
-        if self._configuration.use_metrics:
-            self._schedule_metrics.put_schedule_metrics()
+        # cleanup desired instance states and save
+        ctx.instance_states.cleanup(instance_ids)
+        ctx.instance_states.save()
 
-        # output data
-        result = {"started": started_instances, "stopped": stopped_instances}
-        if self._service.allow_resize:
-            result["resized"] = resized_instances
-        return result
+        return ctx
 
     def _send_usage_metrics(self):
-        usage_data = []
-        for s in list(self._usage_metrics):
-            if len(self._usage_metrics[s]) == 0:
-                del self._usage_metrics[s]
-        if len(self._usage_metrics) > 0:
-            for action in self._usage_metrics:
-                for instance_type in self._usage_metrics.get(action, {}):
-                    usage_data.append(
-                        {
-                            "Service": self._service.service_name,
-                            "Action": action,
-                            "InstanceType": instance_type,
-                            "Instances": self._usage_metrics[action][instance_type],
-                        }
-                    )
-
+        usage_data = [
+            {
+                "Service": self._service_name,
+                "Action": action,
+                "InstanceType": instance_type,
+                "Instances": count,
+            }
+            for action, instance_types in self._usage_metrics.items()
+            for instance_type, count in instance_types.items()
+        ]
+        if len(usage_data) > 0:
             send_metrics_data(usage_data, logger=self._logger)
 
-    def _collect_usage_metrics(self):
-        for i in self._scheduler_start_list:
-            if i.id in [r[0].id for r in self._schedule_resize_list]:
-                instance_type = [
-                    r[1] for r in self._schedule_resize_list if r[0].id == i.id
-                ][0]
-            else:
-                instance_type = i.instancetype
-            if instance_type in self._usage_metrics["Started"]:
-                self._usage_metrics["Started"][instance_type] += 1
+    def _collect_usage_metrics(self, ctx):
+        # started instances that are resized are counted with their new instance type
+        resize_map = {r[0].id: r[1] for r in ctx.resize_list}
+        for i in ctx.start_list:
+            self._usage_metrics["Started"][resize_map.get(i.id, i.instancetype)] += 1
+
+        for i in ctx.stop_list:
+            self._usage_metrics["Stopped"][i.instancetype] += 1
+
+        for i in ctx.resize_list:
+            type_change = f"{i[0].instancetype}-{i[1]}"
+            self._usage_metrics["Resized"][type_change] += 1
+
+    def _need_and_can_resize(self, instance, desired_type):
+        if desired_type is not None and instance.instancetype != desired_type:
+            if not instance.allow_resize:
+                self._logger.warning(
+                    WARN_RESIZE_NOT_SUPPORTED,
+                    instance.instance_str,
+                    instance.instancetype,
+                )
+                return False
             else:
-                self._usage_metrics["Started"][instance_type] = 1
+                return True
+        return False
 
-        for i in self._scheduler_stop_list:
-            if i.instancetype in self._usage_metrics["Stopped"]:
-                self._usage_metrics["Stopped"][i.instancetype] += 1
-            else:
-                self._usage_metrics["Stopped"][i.instancetype] = 1
+    def _resize_instance(self, ctx, instance, new_type):
+        try:
+            # adjust instance type before starting using the resize_instance method in the service_strategy
+            ctx.service.resize_instance(
+                {
+                    **ctx.params,
+                    schedulers.PARAM_TRACE: self._configuration.trace,
+                    schedulers.PARAM_INSTANCE: instance,
+                    schedulers.PARAM_DESIRED_TYPE: new_type,
+                    schedulers.PARAM_CONFIG: self._scheduler_configuration,
+                }
+            )
 
-        for i in self._schedule_resize_list:
-            type_change = "{}-{}".format(i[0].instancetype, i[1])
-            if type_change in self._usage_metrics["Resized"]:
-                self._usage_metrics["Resized"][type_change] += 1
-            else:
-                self._usage_metrics["Resized"][type_change] = 1
+            ctx.resize_list.append((instance, new_type))
+        except Exception as ex:
+            # if changing the instance type does fail do not add instance to start list so it is handled a next time
+            self._logger.error(ERR_SETTING_INSTANCE_TYPE, str(ex))
 
-    # handle new state of an instance
-    def _process_new_desired_state(
+    def _transition_save_desired_state(
         self,
-        account,
-        region,
+        ctx,
         instance,
         desired_state,
         desired_type,
         last_desired_state,
         retain_running,
     ):
-        def need_and_can_resize():
-            if desired_type is not None and instance.instancetype != desired_type:
-                if not instance.allow_resize:
-                    self._logger.warning(
-                        WARN_RESIZE_NOT_SUPPORTED,
-                        instance.instance_str,
-                        instance.instancetype,
-                    )
-                    return False
-                else:
-                    return True
-            return False
+        # just save new desired state
+        ctx.instance_states.set_instance_state(instance.id, desired_state)
 
-        def resize_instance(inst, new_type):
-            try:
-                # adjust instance type before starting using the resize_instance method in the service_strategy
-                self._service.resize_instance(
-                    {
-                        schedulers.PARAM_SESSION: account.session,
-                        schedulers.PARAM_ACCOUNT: account.name,
-                        schedulers.PARAM_ROLE: account.role,
-                        schedulers.PARAM_REGION: region,
-                        schedulers.PARAM_TRACE: self._configuration.trace,
-                        schedulers.PARAM_INSTANCE: instance,
-                        schedulers.PARAM_DESIRED_TYPE: new_type,
-                        schedulers.PARAM_LOGGER: self._logger,
-                        schedulers.PARAM_CONTEXT: self._context,
-                        schedulers.PARAM_CONFIG: self._scheduler_configuration,
-                    }
-                )
+    def _transition_retained_to_running(
+        self,
+        ctx,
+        instance,
+        desired_state,
+        desired_type,
+        last_desired_state,
+        retain_running,
+    ):
+        # don't change last desired state desired whilst in a running period
+        pass
 
-                self._schedule_resize_list.append((inst, new_type))
-            except Exception as ex:
-                # if changing the instance type does fail do not add instance to start list so it is handled a next time
-                self._logger.error(ERR_SETTING_INSTANCE_TYPE, str(ex))
+    def _transition_retained_to_stopped(
+        self,
+        ctx,
+        instance,
+        desired_state,
+        desired_type,
+        last_desired_state,
+        retain_running,
+    ):
+        # save last desired state as stopped (but do not stop) at the end of running period
+        self._logger.debug(
+            INF_DO_NOT_STOP_RETAINED_INSTANCE,
+            instance.id,
+            InstanceSchedule.STATE_STOPPED,
+        )
+        ctx.instance_states.set_instance_state(
+            instance.id, InstanceSchedule.STATE_STOPPED
+        )
 
-        # last desired status was saved as retain-running
-        if last_desired_state == InstanceSchedule.STATE_RETAIN_RUNNING:
-            # don't change last desired state desired whilst in a running period
-            if desired_state == InstanceSchedule.STATE_RUNNING:
-                pass
+    def _transition_to_running(
+        self,
+        ctx,
+        instance,
+        desired_state,
+        desired_type,
+        last_desired_state,
+        retain_running,
+    ):
+        if not instance.is_running:
+            inst_type = (
+                desired_type if desired_type is not None else instance.instancetype
+            )
+            self._logger.debug(
+                DEBUG_STARTED_REGION_INSTANCES,
+                instance.instance_str,
+                instance.region,
+                inst_type,
+            )
 
-            # save last desired state as stopped (but do not stop) at the end of running period
-            elif desired_state == InstanceSchedule.STATE_STOPPED:
-                # safe new desired stopped state but keep running
+            # for instances to be started test if resizing is required
+            if self._need_and_can_resize(instance, desired_type):
+                self._resize_instance(ctx, instance, desired_type)
+
+            # append instance to list of instances to start
+            ctx.start_list.append(instance)
+
+        # instance already running with desired state of running
+        # if retain running option is used in this save desired state as retained running.
+        elif last_desired_state == InstanceSchedule.STATE_STOPPED:
+            if retain_running:
                 self._logger.debug(
-                    INF_DO_NOT_STOP_RETAINED_INSTANCE,
+                    DEBUG_APPLY_RETAIN_RUNNING_STATE,
+                    desired_state,
                     instance.id,
-                    InstanceSchedule.STATE_STOPPED,
+                    InstanceSchedule.STATE_RETAIN_RUNNING,
                 )
-                self._instance_states.set_instance_state(
-                    instance.id, InstanceSchedule.STATE_STOPPED
+                ctx.instance_states.set_instance_state(
+                    instance.id, InstanceSchedule.STATE_RETAIN_RUNNING
                 )
             else:
-                # just save new desired state
-                self._instance_states.set_instance_state(instance.id, desired_state)
-        else:
-            if desired_state == InstanceSchedule.STATE_RUNNING:
-                if not instance.is_running:
-                    inst_type = (
-                        desired_type
-                        if desired_type is not None
-                        else instance.instancetype
-                    )
-                    self._logger.debug(
-                        DEBUG_STARTED_REGION_INSTANCES,
-                        instance.instance_str,
-                        instance.region,
-                        inst_type,
-                    )
+                # instance is running, set last desired state from stopped to started
+                ctx.instance_states.set_instance_state(
+                    instance.id, InstanceSchedule.STATE_RUNNING
+                )
 
-                    # for instances to be started test if resizing is required
-                    if need_and_can_resize():
-                        resize_instance(instance, desired_type)
+        # desired state is running but saved state already saves as retain running
 
-                    # append instance to list of instances to start
-                    self._scheduler_start_list.append(instance)
+    def _transition_to_stopped(
+        self,
+        ctx,
+        instance,
+        desired_state,
+        desired_type,
+        last_desired_state,
+        retain_running,
+    ):
+        if instance.is_running:
+            # instance needs to be stopped
+            self._logger.debug(
+                DEBUG_STOPPED_REGION_INSTANCES,
+                instance.instance_str,
+                instance.region,
+            )
+            # append instance to list of instances to stop
+            if desired_state == InstanceSchedule.STATE_STOPPED_FOR_RESIZE:
+                instance = instance._replace(resized=True)
+            ctx.stop_list.append(instance)
+        # stopped instance with desired state of running but in retained state mode
+        # (manually stopped in running period and already running at start)
+        else:
+            # just save new desired state
+            ctx.instance_states.set_instance_state(
+                instance.id, InstanceSchedule.STATE_STOPPED
+            )
 
-                # instance already running with desired state of running
-                else:
-                    # if retain running option is used in this save desired state as retained running.
-                    if last_desired_state == InstanceSchedule.STATE_STOPPED:
-                        if retain_running:
-                            self._logger.debug(
-                                DEBUG_APPLY_RETAIN_RUNNING_STATE,
-                                desired_state,
-                                instance.id,
-                                InstanceSchedule.STATE_RETAIN_RUNNING,
-                            )
-                            self._instance_states.set_instance_state(
-                                instance.id, InstanceSchedule.STATE_RETAIN_RUNNING
-                            )
-                        else:
-                            # instance is running, set last desired state from stopped to started
-                            self._instance_states.set_instance_state(
-                                instance.id, InstanceSchedule.STATE_RUNNING
-                            )
-
-                            # desired state is running but saved state already saves as retain running
-
-            elif desired_state in [
-                InstanceSchedule.STATE_STOPPED,
-                InstanceSchedule.STATE_STOPPED_FOR_RESIZE,
-            ]:
-                if instance.is_running:
-                    # instance needs to be stopped
-                    self._logger.debug(
-                        DEBUG_STOPPED_REGION_INSTANCES,
-                        instance.instance_str,
-                        instance.region,
-                    )
-                    # append instance to list of instances to start
-                    if desired_state == InstanceSchedule.STATE_STOPPED_FOR_RESIZE:
-                        instance = instance._replace(resized=True)
-                    self._scheduler_stop_list.append(instance)
-                    # stopped instance with desired state of running but in retained state mode
-                    # (manually stopped in running period and already running at start)
-                else:
-                    # just save new desired state
-                    self._instance_states.set_instance_state(
-                        instance.id, InstanceSchedule.STATE_STOPPED
-                    )
+    # handlers for a new desired state, keyed by (last desired state was retain-running, new desired state),
+    # desired states that are not listed are just saved
+    _TRANSITIONS = {
+        (True, InstanceSchedule.STATE_RUNNING): _transition_retained_to_running,
+        (True, InstanceSchedule.STATE_STOPPED): _transition_retained_to_stopped,
+        (False, InstanceSchedule.STATE_RUNNING): _transition_to_running,
+        (False, InstanceSchedule.STATE_STOPPED): _transition_to_stopped,
+        (False, InstanceSchedule.STATE_STOPPED_FOR_RESIZE): _transition_to_stopped,
+    }
 
-            else:
-                self._instance_states.set_instance_state(instance.id, desired_state)
+    # handle new state of an instance
+    def _process_new_desired_state(
+        self,
+        ctx,
+        instance,
+        desired_state,
+        desired_type,
+        last_desired_state,
+        retain_running,
+    ):
+        handler = self._TRANSITIONS.get(
+            (
+                last_desired_state == InstanceSchedule.STATE_RETAIN_RUNNING,
+                desired_state,
+            ),
+            InstanceScheduler._transition_save_desired_state,
+        )
+        handler(
+            self,
+            ctx,
+            instance,
+            desired_state,
+            desired_type,
+            last_desired_state,
+            retain_running,
+        )
+
+    # builds the service action and its parameters to start or stop the listed instances
+    def _dispatch(self, ctx, action, instances, key):
+        return (
+            action,
+            {
+                **ctx.params,
+                schedulers.PARAM_TRACE: self._configuration.trace,
+                key: instances,
+                schedulers.PARAM_STACK: self._stack_name,
+                schedulers.PARAM_CONFIG: self._scheduler_configuration,
+            },
+        )
 
     # start and stop listed instances
-    def _start_and_stop_instances(self, account, region):
-        if len(self._scheduler_start_list) > 0:
+    def _start_and_stop_instances(self, ctx):
+        if len(ctx.start_list) > 0:
             self._logger.info(
                 INF_STARTING_INSTANCES,
-                ", ".join([i.instance_str for i in self._scheduler_start_list]),
-                region,
+                _instances_str(ctx.start_list),
+                ctx.region,
             )
-
-            for inst_id, state in self._service.start_instances(
-                {
-                    schedulers.PARAM_SESSION: account.session,
-                    schedulers.PARAM_ACCOUNT: account.name,
-                    schedulers.PARAM_ROLE: account.role,
-                    schedulers.PARAM_REGION: region,
-                    schedulers.PARAM_TRACE: self._configuration.trace,
-                    schedulers.PARAM_STARTED_INSTANCES: self._scheduler_start_list,
-                    schedulers.PARAM_LOGGER: self._logger,
-                    schedulers.PARAM_CONTEXT: self._context,
-                    schedulers.PARAM_STACK: self._stack_name,
-                    schedulers.PARAM_CONFIG: self._scheduler_configuration,
-                }
-            ):
-                # set state based on returned state from start action
-                self._instance_states.set_instance_state(inst_id, state)
-
-        if len(self._scheduler_stop_list) > 0:
+        if len(ctx.stop_list) > 0:
             self._logger.info(
                 INF_STOPPED_INSTANCES,
-                ", ".join([i.instance_str for i in self._scheduler_stop_list]),
-                region,
+                _instances_str(ctx.stop_list),
+                ctx.region,
             )
-            for inst_id, state in self._service.stop_instances(
-                {
-                    schedulers.PARAM_SESSION: account.session,
-                    schedulers.PARAM_ACCOUNT: account.name,
-                    schedulers.PARAM_ROLE: account.role,
-                    schedulers.PARAM_REGION: region,
-                    schedulers.PARAM_TRACE: self._configuration.trace,
-                    schedulers.PARAM_STOPPED_INSTANCES: self._scheduler_stop_list,
-                    schedulers.PARAM_LOGGER: self._logger,
-                    schedulers.PARAM_CONTEXT: self._context,
-                    schedulers.PARAM_STACK: self._stack_name,
-                    schedulers.PARAM_CONFIG: self._scheduler_configuration,
-                }
-            ):
-                # set state based on start of stop action
-                self._instance_states.set_instance_state(inst_id, state)
+
+        # the services do not make any calls when there are no instances to start or stop
+        actions = [
+            self._dispatch(
+                ctx,
+                ctx.service.start_instances,
+                ctx.start_list,
+                schedulers.PARAM_STARTED_INSTANCES,
+            ),
+            self._dispatch(
+                ctx,
+                ctx.service.stop_instances,
+                ctx.stop_list,
+                schedulers.PARAM_STOPPED_INSTANCES,
+            ),
+        ]
+
+        if len(ctx.start_list) > 0 and len(ctx.stop_list) > 0:
+            # starting and stopping are independent, both actions are executed concurrently
+            with ThreadPoolExecutor(max_workers=len(actions)) as executor:
+                futures = [
+                    executor.submit(lambda a, p: list(a(p)), action, params)
+                    for action, params in actions
+                ]
+                results = [future.result() for future in futures]
+        else:
+            results = [list(action(params)) for action, params in actions]
+
+        # set state based on returned state from start or stop action, states are only updated from this thread
+        for result in results:
+            for inst_id, state in result:
+                ctx.instance_states.set_instance_state(inst_id, state)
@@ -186,6 +186,9 @@ class InstanceStates:
             self._timestamp = time.time()
             self._dirty = True
 
+            # set for constant time lookups of the instances returned by the service
+            instances = set(instances)
+
             # get key of stored instances
             stored_instances = [i for i in list(self._state_info)]
             for i in stored_instances:
@@ -76,6 +76,14 @@ class RdsService:
         self._stack_name = None
         self._config = None
 
+    def clone(self):
+        """
+        Creates a new service instance, the scheduler uses a clone for each region it processes as the service keeps
+        state for the region it is processing
+        :return: new service instance
+        """
+        return RdsService()
+
     def _init_scheduler(self, args):
         """
         Initializes common parameters
@@ -481,14 +489,16 @@ class RdsService:
 
     # noinspection PyMethodMayBeStatic
     def stop_instances(self, kwargs):
+        stopped_instances = kwargs["stopped_instances"]
+        if len(stopped_instances) == 0:
+            return
+
         self._init_scheduler(kwargs)
 
         client = get_client_with_standard_retry(
             "rds", session=self._session, region=self._region
         )
 
-        stopped_instances = kwargs["stopped_instances"]
-
         for rds_resource in stopped_instances:
             try:
                 if rds_resource.is_cluster:
@@ -510,13 +520,15 @@ class RdsService:
 
     # noinspection PyMethodMayBeStatic
     def start_instances(self, kwargs):
+        started_instances = kwargs["started_instances"]
+        if len(started_instances) == 0:
+            return
+
         self._init_scheduler(kwargs)
 
         client = get_client_with_standard_retry(
             "rds", session=self._session, region=self._region
         )
-
-        started_instances = kwargs["started_instances"]
         for rds_resource in started_instances:
             try:
                 if rds_resource.is_cluster:
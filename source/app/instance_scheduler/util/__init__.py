@@ -5,6 +5,7 @@
 
 import json
 
+from instance_scheduler.boto_retry import MAX_POOL_CONNECTIONS
 from instance_scheduler.util.custom_encoder import CustomEncoder
 import botocore
 import os
@@ -46,5 +47,8 @@ def get_config():
     solution_config = {
         "user_agent_extra": user_agent_extra_string,
         "retries": {"max_attempts": 5, "mode": "standard"},
+        # resources created with this config are shared by the threads processing accounts and regions
+        "max_pool_connections": MAX_POOL_CONNECTIONS,
+        "tcp_keepalive": True,
     }
     return botocore.config.Config(**solution_config)
@@ -3,11 +3,30 @@
 # SPDX-License-Identifier: Apache-2.0
 
 
+import threading
+
 import boto3
 from instance_scheduler import util
 
 
 class DynamoDBUtils:
+    # resources are created from the shared default boto3 session, which is not thread safe
+    _lock = threading.Lock()
+    # boto3 resources are not thread safe either, so table resources are cached per thread and reused by all
+    # requests handled by that thread of a (warm) Lambda container
+    _local = threading.local()
+
     @staticmethod
     def get_dynamodb_table_resource_ref(table_name):
-        return boto3.resource("dynamodb", config=util.get_config()).Table(table_name)
+        tables = getattr(DynamoDBUtils._local, "tables", None)
+        if tables is None:
+            tables = DynamoDBUtils._local.tables = {}
+
+        table = tables.get(table_name)
+        if table is None:
+            with DynamoDBUtils._lock:
+                table = boto3.resource("dynamodb", config=util.get_config()).Table(
+                    table_name
+                )
+            tables[table_name] = table
+        return table
@@ -4,6 +4,7 @@
 
 
 import os
+import threading
 import time
 from datetime import datetime
 
@@ -49,8 +50,15 @@ class Logger:
         self._loggroup = (
             loggroup if loggroup is not None else get_loggroup(self._context)
         )
+        # messages are only echoed to stdout when not running in Lambda
+        self._log_to_stdout = (
+            self._context is None
+            and str(os.getenv(ENV_SUPPRESS_LOG_STDOUT, False)).lower() != "true"
+        )
 
         self._sns = None
+        # the logger is shared by the threads that process accounts
+        self._lock = threading.RLock()
 
     def __enter__(self):
         """
@@ -74,20 +82,18 @@ class Logger:
         t = time.time()
         s = LOG_FORMAT.format(level, s)
 
-        if self._cached_size + (len(s) + LOG_ENTRY_ADDITIONAL) > LOG_MAX_BATCH_SIZE:
-            self.flush()
+        with self._lock:
+            if self._cached_size + (len(s) + LOG_ENTRY_ADDITIONAL) > LOG_MAX_BATCH_SIZE:
+                self.flush()
 
-        self._cached_size += len(s) + LOG_ENTRY_ADDITIONAL
+            self._cached_size += len(s) + LOG_ENTRY_ADDITIONAL
 
-        if (
-            self._context is None
-            and str(os.getenv(ENV_SUPPRESS_LOG_STDOUT, False)).lower() != "true"
-        ):
-            print("> " + s)
-        self._buffer.append((int(t * 1000), s))
+            if self._log_to_stdout:
+                print("> " + s)
+            self._buffer.append((int(t * 1000), s))
 
-        if len(self._buffer) >= self._buffer_size:
-            self.flush()
+            if len(self._buffer) >= self._buffer_size:
+                self.flush()
 
         return s
 
@@ -187,31 +193,34 @@ class Logger:
         :return:
         """
 
-        if len(self._buffer) == 0:
-            return
-
-        put_event_args = {
-            "logGroupName": self._loggroup,
-            "logStreamName": self._logstream,
-            "logEvents": [{"timestamp": r[0], "message": r[1]} for r in self._buffer],
-        }
-
-        retries = 5
-        while retries > 0:
-            try:
-                self.client.put_log_events(**put_event_args)
-                self._buffer = []
-                self._cached_size = 0
-                return
-            except self.client.exceptions.ResourceNotFoundException:
-                retries -= 1
-                self.client.create_log_stream(
-                    logGroupName=self._loggroup, logStreamName=self._logstream
-                )
-            except self.client.exceptions.InvalidSequenceTokenException as ex:
-                retries -= 1
-                put_event_args["sequenceToken"] = ex.response.get(
-                    "expectedSequenceToken"
-                )
-            except Exception:
+        with self._lock:
+            if len(self._buffer) == 0:
                 return
+
+            put_event_args = {
+                "logGroupName": self._loggroup,
+                "logStreamName": self._logstream,
+                "logEvents": [
+                    {"timestamp": r[0], "message": r[1]} for r in self._buffer
+                ],
+            }
+
+            retries = 5
+            while retries > 0:
+                try:
+                    self.client.put_log_events(**put_event_args)
+                    self._buffer = []
+                    self._cached_size = 0
+                    return
+                except self.client.exceptions.ResourceNotFoundException:
+                    retries -= 1
+                    self.client.create_log_stream(
+                        logGroupName=self._loggroup, logStreamName=self._logstream
+                    )
+                except self.client.exceptions.InvalidSequenceTokenException as ex:
+                    retries -= 1
+                    put_event_args["sequenceToken"] = ex.response.get(
+                        "expectedSequenceToken"
+                    )
+                except Exception:
+                    return
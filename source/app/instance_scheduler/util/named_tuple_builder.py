@@ -4,6 +4,7 @@
 
 
 import collections
+import functools
 
 
 # check for dictionaries
@@ -15,6 +16,7 @@ def is_array(o):
     return isinstance(o, type([]))
 
 
+@functools.lru_cache(maxsize=512)
 def tuple_name_func(name):
     result = "".join([c if c.isalnum() or c == "_" else "" for c in name.strip()])
     while result.startswith("_") or result[0].isdigit():
@@ -54,4 +56,10 @@ def as_namedtuple(name, d, deep=True, namefunc=None, excludes=None):
     else:
         dest = {name_func(key): d[key] for key in list(d)}
 
-    return collections.namedtuple(name_func(name), list(dest))(*dest.values())
+    return _namedtuple_class(name_func(name), tuple(dest))(*dest.values())
+
+
+# creating a namedtuple class is expensive, classes are reused for tuples with the same name and fields
+@functools.lru_cache(maxsize=128)
+def _namedtuple_class(name, fields):
+    return collections.namedtuple(name, fields)
@@ -4,6 +4,7 @@
 
 
 import os
+import threading
 
 from instance_scheduler import configuration
 from instance_scheduler.boto_retry import get_client_with_standard_retry
@@ -35,6 +36,8 @@ class SchedulerMetrics:
         self._namespace = "{}:{}".format(self._stack, SchedulerMetrics.NAMESPACE)
 
         self._metrics_client = None
+        # metrics are added by the threads that process accounts
+        self._lock = threading.Lock()
 
     @property
     def metrics_client(self):
@@ -50,7 +53,9 @@ class SchedulerMetrics:
         :param instance: scheduled instance
         :return:
         """
-        if schedule.use_metrics:
+        if not schedule.use_metrics:
+            return
+        with self._lock:
             if service not in self._metrics_managed:
                 self._metrics_managed[service] = {}
                 self._metrics_running[service] = {}
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from freezegun import freeze_time
+
+from instance_scheduler.configuration.scheduler_config import SchedulerConfig
+
+
+@freeze_time("2023-06-01 09:05:00")
+def test_build_tags_from_template_substitutes_variables():
+    tags = SchedulerConfig.build_tags_from_template(
+        "msg=Stopped on {year}/{month}/{day} at {hour}:{minute} {timezone},"
+        "custom={name} in {unknown},literal=no placeholders,empty=",
+        tag_variables={"name": "test-instance"},
+    )
+
+    assert tags == {
+        "msg": "Stopped on 2023/06/01 at 09:05 UTC",
+        "custom": "test-instance in {unknown}",
+        "literal": "no placeholders",
+        "empty": "",
+    }
+
+
+def test_build_tags_from_template_keeps_commas_in_values():
+    tags = SchedulerConfig.build_tags_from_template("a=1,2,3,b=4")
+
+    assert tags == {"a": "1,2,3", "b": "4"}
+
+
+def test_build_tags_from_template_keeps_equal_signs_in_values():
+    tags = SchedulerConfig.build_tags_from_template("ignored,a=x=y,b=")
+
+    assert tags == {"a": "x=y", "b": ""}
+
+
+def test_build_tags_from_template_results_can_be_modified_by_caller():
+    tags = SchedulerConfig.build_tags_from_template("a=1")
+    tags["a"] = "2"
+
+    assert SchedulerConfig.build_tags_from_template("a=1") == {"a": "1"}
+
+
+def test_build_tags_from_template_refreshes_time_variables():
+    with freeze_time("2023-06-01 09:05:00"):
+        assert SchedulerConfig.build_tags_from_template("t={minute}") == {"t": "05"}
+    with freeze_time("2023-06-01 09:06:00"):
+        assert SchedulerConfig.build_tags_from_template("t={minute}") == {"t": "06"}
+
+
+def test_tag_list_skips_reserved_tag_prefixes():
+    assert SchedulerConfig.tag_list(
+        {"aws:reserved": "1", "cloudformation:stack": "2", "tag": "3"}
+    ) == [{"Key": "tag", "Value": "3"}]
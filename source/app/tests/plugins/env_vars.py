@@ -14,6 +14,7 @@ CONFIG_TABLE_NAME = "mock-schedule-state-table"
 def pytest_load_initial_conftests():
     os.environ["SCHEDULE_STATES_TABLE"] = TABLE_NAME
     os.environ["CONFIG_TABLE"] = CONFIG_TABLE_NAME
+    os.environ["MAINTENANCE_WINDOW_TABLE"] = "test_table"
     os.environ["LOG_GROUP"] = "instance-scheduler-logs"
     os.environ["ACCOUNT"] = "111111111111"
     os.environ["SSM_EXECUTION_ROLE_NAME"] = "role/role_name"
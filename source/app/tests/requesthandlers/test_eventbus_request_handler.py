@@ -17,8 +17,8 @@ def ddb_setup(dynamodb_client_resource):
     dynamodb_client_resource.create_table(
         TableName=table_name,
         KeySchema=[
-            {"AttributeName": "name", "KeyType": "HASH"},
             {"AttributeName": "type", "KeyType": "HASH"},
+            {"AttributeName": "name", "KeyType": "RANGE"},
         ],
         AttributeDefinitions=[
             {"AttributeName": "name", "AttributeType": "S"},
@@ -81,3 +81,20 @@ def test_handler(dynamodb_client_resource):
 
         response = handler.handle_request()
         assert response == "Exiting event bus request handler"
+
+
+def test_handler_clears_cached_account_data(mocker):
+    mocker.patch.object(DynamoDBUtils, "get_dynamodb_table_resource_ref")
+    module = "instance_scheduler.requesthandlers.eventbus_request_handler"
+    clear_windows = mocker.patch(f"{module}.clear_ssm_windows_cache")
+    clear_credentials = mocker.patch(f"{module}.clear_role_credentials")
+    event = {
+        "detail-type": "Parameter Store Change",
+        "account": "111111111111",
+        "detail": {"operation": "Delete"},
+    }
+
+    EventBusRequestHandler(event, {}).handle_request()
+
+    clear_windows.assert_called_once_with("111111111111")
+    clear_credentials.assert_called_once_with("111111111111")
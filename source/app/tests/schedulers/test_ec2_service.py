@@ -4,14 +4,15 @@
 
 from unittest import mock
 import os
-from instance_scheduler import configuration
-
-mock.patch.dict(os.environ, {configuration.ENV_SCHEDULE_FREQUENCY: "10"}).start()
-mock.patch.dict(os.environ, {"MAINTENANCE_WINDOW_TABLE": "test_table"}).start()
-
+import pytest
+from instance_scheduler import configuration, schedulers
 from instance_scheduler.schedulers import Ec2Service
 import datetime
-from freezegun import freeze_time
+
+
+@pytest.fixture(autouse=True)
+def schedule_frequency(monkeypatch):
+    monkeypatch.setenv(configuration.ENV_SCHEDULE_FREQUENCY, "10")
 
 
 def test_ssm_maintenance_windows_1(mocker):
@@ -72,7 +73,27 @@ def test_ssm_maintenance_windows_2(mocker):
     assert response["mon-1"].periods[0]["period"].monthdays == {10}
 
 
-@freeze_time("2020-05-10 15:30:34")
+def test_same_named_windows_in_different_timezones_get_their_own_periods(mocker):
+    ec2_service = Ec2Service()
+    mocker.patch.object(ec2_service, "_logger")
+    begin_times = []
+    # both windows start at the same UTC time, their periods are built from their own local time
+    for execution_time, timezone in [
+        ("2020-05-10T03:00-04:00", "US/Eastern"),
+        ("2020-05-10T08:00+01:00", "Europe/London"),
+    ]:
+        schedule = ec2_service._schedule_from_maint_window(
+            name="patch",
+            start=datetime.datetime.fromisoformat(execution_time),
+            hours=1,
+            interval=10,
+            timezone=timezone,
+        )
+        begin_times.append(schedule.periods[0]["period"].begintime)
+
+    assert begin_times == [datetime.time(2, 50), datetime.time(7, 50)]
+
+
 def test_check_window_running_1(mocker):
     window = {
         "WindowId": "mw-018e7137c74304cb5",
@@ -83,11 +104,10 @@ def test_check_window_running_1(mocker):
         "Schedule": "cron(0 10 19 ? * * *)",
         "NextExecutionTime": "2020-05-10T15:00Z",
     }
-    ec2_service = Ec2Service()
+    ec2_service = Ec2Service(now=lambda: datetime.datetime(2020, 5, 10, 15, 30, 34))
     assert ec2_service.check_window_running(window)
 
 
-@freeze_time("2020-05-11 15:30:34")
 def test_check_window_running_2(mocker):
     window = {
         "WindowId": "mw-018e7137c74304cb5",
@@ -98,10 +118,22 @@ def test_check_window_running_2(mocker):
         "Schedule": "cron(0 10 19 ? * * *)",
         "NextExecutionTime": "2020-05-10T15:00Z",
     }
-    ec2_service = Ec2Service()
+    ec2_service = Ec2Service(now=lambda: datetime.datetime(2020, 5, 11, 15, 30, 34))
     assert not ec2_service.check_window_running(window)
 
 
+def test_check_window_running_in_schedule_timezone(mocker):
+    window = {
+        "WindowId": "mw-018e7137c74304cb5",
+        "Name": "mon-1",
+        "Duration": 1,
+        "ScheduleTimezone": "US/Eastern",
+        "NextExecutionTime": "2020-05-10T15:00-04:00",
+    }
+    ec2_service = Ec2Service(now=lambda: datetime.datetime(2020, 5, 10, 19, 30, 34))
+    assert ec2_service.check_window_running(window)
+
+
 def test_get_ssm_windows(mocker):
     window_list = [
         {
@@ -111,6 +143,9 @@ def test_get_ssm_windows(mocker):
             "NextExecutionTime": "2020-04-09T19:00Z",
         }
     ]
+    mocker.patch.dict(
+        "instance_scheduler.schedulers.ec2_service._ssm_windows_cache", clear=True
+    )
     ec2_service = Ec2Service()
     mocker.patch.object(ec2_service, "get_ssm_windows_service")
     mocker.patch.object(ec2_service, "get_ssm_windows_db")
@@ -125,6 +160,26 @@ def test_get_ssm_windows(mocker):
     assert response == window_list
 
 
+def test_get_ssm_windows_uses_cache(mocker):
+    mocker.patch.dict(
+        "instance_scheduler.schedulers.ec2_service._ssm_windows_cache", clear=True
+    )
+    loaded = datetime.datetime(2020, 5, 10, 15, 0, 0)
+    clock = mocker.MagicMock()
+    ec2_service = Ec2Service(now=clock)
+    mocker.patch.object(ec2_service, "get_ssm_windows_service", return_value=[])
+    mocker.patch.object(ec2_service, "get_ssm_windows_db", return_value=[])
+
+    # loaded at 0, reused within the ttl and loaded again after it expired
+    for seconds in [0, 599, 600]:
+        clock.return_value = loaded + datetime.timedelta(seconds=seconds)
+        ec2_service.get_ssm_windows("", "", "1111", "us-east-1")
+
+    assert ec2_service.get_ssm_windows_service.call_count == 2
+    ec2_service.get_ssm_windows("", "", "1111", "eu-west-1")
+    assert ec2_service.get_ssm_windows_service.call_count == 3
+
+
 def test_process_ssm_window_1(mocker):
     ssm_windows_db = [
         {
@@ -190,3 +245,117 @@ def test_process_ssm_window_2(mocker):
     region = "us-east-1"
     ec2_service.process_ssm_window(window, ssm_windows_db, account, region)
     ec2_service.put_window_dynamodb.assert_called_with(window, account, region)
+
+
+def test_start_instances_processes_all_batches(mocker):
+    mocker.patch.dict(os.environ, {"START_EC2_BATCH_SIZE": "2"})
+    mocker.patch("instance_scheduler.schedulers.ec2_service.time.sleep")
+    client = mocker.patch(
+        "instance_scheduler.schedulers.ec2_service.get_client_with_standard_retry"
+    ).return_value
+    # the first instance of the first batch is only reported as pending by the status check
+    client.start_instances.side_effect = [
+        {"StartingInstances": [{"InstanceId": "i-2", "CurrentState": {"Code": 0}}]},
+        {"StartingInstances": [{"InstanceId": "i-3", "CurrentState": {"Code": 0}}]},
+    ]
+    client.describe_instances.return_value = {
+        "Reservations": [
+            {
+                "Instances": [
+                    {"InstanceId": "i-1", "State": {"Code": 0}},
+                    {"InstanceId": "i-2", "State": {"Code": 0}},
+                ]
+            }
+        ]
+    }
+    config = mocker.MagicMock(started_tags=[], stopped_tags=[])
+    instances = [mocker.MagicMock(id=inst_id) for inst_id in ["i-1", "i-2", "i-3"]]
+
+    ec2_service = Ec2Service()
+    started = list(
+        ec2_service.start_instances(
+            {
+                schedulers.PARAM_STARTED_INSTANCES: instances,
+                schedulers.PARAM_CONFIG: config,
+                schedulers.PARAM_LOGGER: mocker.MagicMock(),
+            }
+        )
+    )
+
+    assert [inst_id for inst_id, _ in started] == ["i-1", "i-2", "i-3"]
+
+
+def test_batch_size_falls_back_to_default(mocker):
+    ec2_service = Ec2Service()
+    ec2_service._logger = mocker.MagicMock()
+
+    mocker.patch.dict(os.environ, {"STOP_EC2_BATCH_SIZE": "200"})
+    assert ec2_service.batch_size("STOP_EC2_BATCH_SIZE", 50) == 200
+
+    mocker.patch.dict(os.environ, {"STOP_EC2_BATCH_SIZE": "many"})
+    assert ec2_service.batch_size("STOP_EC2_BATCH_SIZE", 50) == 50
+    ec2_service._logger.warning.assert_called_once()
+
+    mocker.patch.dict(os.environ, {}, clear=True)
+    assert ec2_service.batch_size("STOP_EC2_BATCH_SIZE", 50) == 50
+
+
+def test_get_schedulable_instances_filters_on_schedule_tag(mocker):
+    client = mocker.patch(
+        "instance_scheduler.schedulers.ec2_service.get_client_with_standard_retry"
+    ).return_value
+    client.describe_instances.side_effect = [
+        {"Reservations": [], "NextToken": "page-2"},
+        {"Reservations": []},
+    ]
+    config = mocker.MagicMock(
+        tag_name="Schedule", schedules={}, enable_SSM_maintenance_windows=False
+    )
+
+    ec2_service = Ec2Service()
+    list(
+        ec2_service.get_schedulable_instances(
+            {
+                schedulers.PARAM_SESSION: None,
+                schedulers.PARAM_CONTEXT: None,
+                schedulers.PARAM_REGION: "us-east-1",
+                schedulers.PARAM_ACCOUNT: "111111111111",
+                schedulers.PARAM_LOGGER: mocker.MagicMock(),
+                schedulers.PARAM_CONFIG: config,
+            }
+        )
+    )
+
+    filters = [{"Name": "tag-key", "Values": ["Schedule"]}]
+    assert client.describe_instances.call_args_list == [
+        mock.call(Filters=filters, MaxResults=1000),
+        mock.call(Filters=filters, MaxResults=1000, NextToken="page-2"),
+    ]
+
+
+def test_start_and_stop_without_instances_make_no_calls(mocker):
+    client = mocker.patch(
+        "instance_scheduler.schedulers.ec2_service.get_client_with_standard_retry"
+    )
+    ec2_service = Ec2Service()
+
+    assert (
+        list(ec2_service.start_instances({schedulers.PARAM_STARTED_INSTANCES: []}))
+        == []
+    )
+    assert (
+        list(ec2_service.stop_instances({schedulers.PARAM_STOPPED_INSTANCES: []})) == []
+    )
+    client.assert_not_called()
+
+
+def test_ssm_maintenance_windows_without_windows_do_not_read_frequency(
+    mocker, monkeypatch
+):
+    monkeypatch.delenv(configuration.ENV_SCHEDULE_FREQUENCY)
+    ec2_service = Ec2Service()
+    mocker.patch.object(ec2_service, "get_ssm_windows", return_value=[])
+    mocker.patch.object(ec2_service, "_logger")
+
+    assert ec2_service.ssm_maintenance_windows("", "", "1111", "us-east-1") == {}
+    ec2_service._logger.error.assert_not_called()
@@ -4,14 +4,23 @@
 
 from unittest import mock
 import os
+import threading
+from datetime import datetime, timedelta, timezone
+from instance_scheduler import schedulers
 from instance_scheduler.configuration.instance_schedule import InstanceSchedule
 from instance_scheduler.schedulers import Ec2Service
 from instance_scheduler.util.named_tuple_builder import as_namedtuple
-from instance_scheduler.schedulers.instance_scheduler import InstanceScheduler
+from instance_scheduler.schedulers.instance_scheduler import (
+    InstanceScheduler,
+    LOG_MAX_INSTANCES,
+    _RegionContext,
+    _instances_str,
+    clear_role_credentials,
+)
 from unittest.mock import patch, MagicMock, ANY
 
 
-@patch("boto3.Session")
+@patch("instance_scheduler.schedulers.instance_scheduler.default_session")
 @patch("instance_scheduler.schedulers.Ec2Service")
 def test_scheduler_uses_regional_sts_endpoint(mock_ec2_service, mock_session):
     mock_session.return_value.client = MagicMock()
@@ -90,3 +99,236 @@ def test_get_desired_state_and_type_2(mocker):
     mocker.patch.object(scheduler, "_logger")
     inst_state, inst_type = scheduler.get_desired_state_and_type(schedule, inst)
     assert inst_state == "stopped"
+
+
+class SchedulerTestService:
+    service_name = "ec2"
+    allow_resize = False
+
+    def clone(self):
+        return SchedulerTestService()
+
+    def get_schedulable_instances(self, kwargs):
+        return [
+            {
+                "id": "i-{}".format(kwargs[schedulers.PARAM_ACCOUNT]),
+                "name": "",
+                "schedule_name": "always-running",
+                "current_state": InstanceSchedule.STATE_STOPPED,
+                "instancetype": "t2.micro",
+                "is_running": False,
+                "is_terminated": False,
+                "maintenance_window": None,
+                "allow_resize": False,
+                "hibernate": False,
+                "resized": False,
+            }
+        ]
+
+    def start_instances(self, kwargs):
+        for instance in kwargs[schedulers.PARAM_STARTED_INSTANCES]:
+            yield instance.id, InstanceSchedule.STATE_RUNNING
+
+    def stop_instances(self, kwargs):
+        return iter(())
+
+
+def test_run_processes_all_accounts(mocker):
+    mock_states = mocker.patch(
+        "instance_scheduler.schedulers.instance_scheduler.InstanceStates"
+    )
+    mock_states.return_value.get_instance_state.return_value = (
+        InstanceSchedule.STATE_STOPPED
+    )
+    accounts = [
+        as_namedtuple("Account", {"session": None, "name": name, "role": None})
+        for name in ["111111111111", "222222222222"]
+    ]
+    mocker.patch.object(
+        InstanceScheduler,
+        "_accounts",
+        new_callable=mocker.PropertyMock,
+        return_value=iter(accounts),
+    )
+    config = MagicMock()
+    config.regions = ["us-east-1"]
+    config.trace = False
+    config.use_metrics = False
+    config.get_schedule.return_value = InstanceSchedule(
+        name="always-running", timezone="UTC", override_status="running"
+    )
+
+    scheduler = InstanceScheduler(SchedulerTestService(), config)
+    response = scheduler.run(
+        state_table="state-table", scheduler_config=config, logger=MagicMock()
+    )
+
+    assert response == {
+        account: {
+            "started": {"us-east-1": {"i-" + account: {"schedule": "always-running"}}},
+            "stopped": {},
+        }
+        for account in ["111111111111", "222222222222"]
+    }
+
+
+def test_single_account_and_region_is_processed_on_calling_thread(mocker):
+    threads = []
+    mocker.patch(
+        "instance_scheduler.schedulers.instance_scheduler.InstanceStates",
+        side_effect=lambda *args: threads.append(threading.current_thread())
+        or MagicMock(),
+    )
+    account = as_namedtuple(
+        "Account", {"session": None, "name": "111111111111", "role": None}
+    )
+    mocker.patch.object(
+        InstanceScheduler,
+        "_accounts",
+        new_callable=mocker.PropertyMock,
+        return_value=iter([account]),
+    )
+    config = MagicMock(regions=["us-east-1"], trace=False, use_metrics=False)
+    config.get_schedule.return_value = None
+
+    scheduler = InstanceScheduler(SchedulerTestService(), config)
+    scheduler.run(
+        state_table="state-table", scheduler_config=config, logger=MagicMock()
+    )
+
+    assert threads == [threading.current_thread()]
+
+
+def test_assumed_role_credentials_are_reused_until_expiry(mocker):
+    mocker.patch.dict(
+        "instance_scheduler.schedulers.instance_scheduler._role_credentials", clear=True
+    )
+    scheduler = InstanceScheduler(service=MagicMock(), scheduler_configuration={})
+    scheduler._sts_client = MagicMock()
+    scheduler._sts_client.assume_role.side_effect = [
+        {"Credentials": {"Expiration": datetime.now(timezone.utc) + delta}}
+        for delta in [timedelta(minutes=2), timedelta(hours=1)]
+    ]
+    role = "arn:aws:iam::111111111111:role/scheduler-role"
+
+    # credentials expiring within the margin are refreshed, valid credentials are reused
+    for _ in range(3):
+        scheduler._get_role_credentials(role, "session")
+
+    assert scheduler._sts_client.assume_role.call_count == 2
+
+
+def test_assumed_role_credentials_are_cached_per_session_name(mocker):
+    credentials = mocker.patch.dict(
+        "instance_scheduler.schedulers.instance_scheduler._role_credentials", clear=True
+    )
+    scheduler = InstanceScheduler(service=MagicMock(), scheduler_configuration={})
+    scheduler._sts_client = MagicMock()
+    scheduler._sts_client.assume_role.return_value = {
+        "Credentials": {"Expiration": datetime.now(timezone.utc) + timedelta(hours=1)}
+    }
+    role = "arn:aws:iam::111111111111:role/scheduler-role"
+
+    scheduler._get_role_credentials(role, "ec2-scheduler-111111111111")
+    scheduler._get_role_credentials(role, "rds-scheduler-111111111111")
+    assert scheduler._sts_client.assume_role.call_count == 2
+
+    clear_role_credentials("111111111111")
+    assert credentials == {}
+
+
+def test_retained_running_instance_is_not_stopped(mocker):
+    scheduler = InstanceScheduler(service=MagicMock(), scheduler_configuration={})
+    scheduler._logger = MagicMock()
+    ctx = _RegionContext(None, "us-east-1", MagicMock(), MagicMock(), {})
+    instance = as_namedtuple("ec2Instance", {"id": "i-1", "is_running": True})
+
+    scheduler._process_new_desired_state(
+        ctx=ctx,
+        instance=instance,
+        desired_state=InstanceSchedule.STATE_STOPPED,
+        desired_type=None,
+        last_desired_state=InstanceSchedule.STATE_RETAIN_RUNNING,
+        retain_running=True,
+    )
+
+    assert ctx.stop_list == []
+    ctx.instance_states.set_instance_state.assert_called_once_with(
+        "i-1", InstanceSchedule.STATE_STOPPED
+    )
+
+
+def test_terminated_instances_are_not_built_as_full_instances():
+    service = MagicMock(service_name="ec2")
+    service.get_schedulable_instances.return_value = [
+        {"id": "i-1", "name": "web", "is_terminated": True}
+    ]
+    scheduler = InstanceScheduler(service=service, scheduler_configuration={})
+    account = as_namedtuple("Account", {"session": None, "name": "111", "role": None})
+    ctx = _RegionContext(account, "us-east-1", service, MagicMock(), {})
+
+    instances = list(scheduler._scheduled_instances_in_region(ctx))
+
+    assert instances == [("i-1", "111", True)]
+    assert instances[0].is_terminated
+
+
+def test_start_and_stop_instances_saves_states_of_both_actions():
+    service = MagicMock(service_name="ec2")
+    service.start_instances.return_value = iter(
+        [("i-1", InstanceSchedule.STATE_RUNNING)]
+    )
+    service.stop_instances.return_value = iter(
+        [("i-2", InstanceSchedule.STATE_STOPPED)]
+    )
+    scheduler = InstanceScheduler(service=service, scheduler_configuration={})
+    scheduler._configuration = MagicMock(trace=False)
+    scheduler._logger = MagicMock()
+    ctx = _RegionContext(None, "us-east-1", service, MagicMock(), {})
+    ctx.start_list = [MagicMock(id="i-1", instance_str="EC2:i-1")]
+    ctx.stop_list = [MagicMock(id="i-2", instance_str="EC2:i-2")]
+
+    scheduler._start_and_stop_instances(ctx)
+
+    ctx.instance_states.set_instance_state.assert_has_calls(
+        [
+            mock.call("i-1", InstanceSchedule.STATE_RUNNING),
+            mock.call("i-2", InstanceSchedule.STATE_STOPPED),
+        ]
+    )
+
+
+def test_long_instance_lists_are_truncated_in_log_messages():
+    instances = [
+        as_namedtuple("Instance", {"instance_str": "i-{}".format(i)})
+        for i in range(LOG_MAX_INSTANCES + 3)
+    ]
+
+    assert _instances_str(instances[:2]) == "i-0, i-1"
+    s = _instances_str(instances)
+    assert s.endswith("i-{} (+3 more)".format(LOG_MAX_INSTANCES - 1))
+    assert "i-{}".format(LOG_MAX_INSTANCES) not in s
+
+
+def test_regions_are_processed_with_clones_of_the_service(mocker):
+    mocker.patch("instance_scheduler.schedulers.instance_scheduler.InstanceStates")
+    now = datetime(2020, 5, 10, 15, 30, 34)
+    service = Ec2Service(now=lambda: now)
+    used = []
+    mocker.patch.object(
+        Ec2Service,
+        "get_schedulable_instances",
+        autospec=True,
+        side_effect=lambda svc, kwargs: used.append((svc, svc._now())) or [],
+    )
+    account = as_namedtuple("Account", {"session": None, "name": "111", "role": None})
+    scheduler = InstanceScheduler(service, {})
+    scheduler._configuration = MagicMock()
+    scheduler._logger = MagicMock()
+
+    scheduler._process_region(account, "us-east-1")
+
+    # the region is processed with its own service instance that keeps the injected clock
+    assert len(used) == 1
+    assert used[0][0] is not service
+    assert used[0][1] == now
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from unittest.mock import MagicMock
+from instance_scheduler.schedulers.instance_states import InstanceStates
+
+
+def test_unchanged_instance_states_are_not_written():
+    instance_states = InstanceStates("test_table", "ec2", MagicMock(), None)
+    table = MagicMock()
+    table.get_item.return_value = {
+        "Item": {"i-0001": "running", "i-0002": "stopped", "timestamp": 1}
+    }
+    instance_states._state_table = table
+
+    instance_states.load("111111111111", "us-east-1")
+    instance_states.set_instance_state("i-0001", "running")
+    instance_states.set_instance_state("i-0002", "stopped")
+    instance_states.save()
+    table.put_item.assert_not_called()
+
+    instance_states.set_instance_state("i-0002", "running")
+    instance_states.save()
+    table.put_item.assert_called_once()
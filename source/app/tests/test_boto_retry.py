@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import boto3
+
+from instance_scheduler.boto_retry import (
+    DEFAULT_MAX_POOL_CONNECTIONS,
+    get_client_with_standard_retry,
+    parse_max_pool_connections,
+)
+
+
+def test_clients_are_cached_per_service_and_region():
+    client = get_client_with_standard_retry("ec2", region="us-east-1")
+
+    assert get_client_with_standard_retry("ec2", region="us-east-1") is client
+    assert get_client_with_standard_retry("ec2", region="us-west-2") is not client
+    assert get_client_with_standard_retry("ssm", region="us-east-1") is not client
+
+
+def test_clients_are_cached_per_session():
+    session = boto3.Session(region_name="us-east-1")
+    client = get_client_with_standard_retry("ec2", session=session)
+
+    assert get_client_with_standard_retry("ec2", session=session) is client
+    assert get_client_with_standard_retry("ec2") is not client
+    assert (
+        get_client_with_standard_retry(
+            "ec2", session=boto3.Session(region_name="us-east-1")
+        )
+        is not client
+    )
+
+
+def test_invalid_pool_sizes_fall_back_to_default():
+    assert parse_max_pool_connections("10") == 10
+    for value in [None, "abc", "0", "-5"]:
+        assert parse_max_pool_connections(value) == DEFAULT_MAX_POOL_CONNECTIONS
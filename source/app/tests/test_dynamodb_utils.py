@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from concurrent.futures import ThreadPoolExecutor
+
+from instance_scheduler.util.dynamodb_utils import DynamoDBUtils
+
+
+def test_table_resources_are_cached_per_thread():
+    table = DynamoDBUtils.get_dynamodb_table_resource_ref("cached-table")
+
+    assert DynamoDBUtils.get_dynamodb_table_resource_ref("cached-table") is table
+    assert DynamoDBUtils.get_dynamodb_table_resource_ref("other-table") is not table
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other_thread_table = executor.submit(
+            DynamoDBUtils.get_dynamodb_table_resource_ref, "cached-table"
+        ).result()
+    assert other_thread_table is not table
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from instance_scheduler.util.named_tuple_builder import as_namedtuple
+
+
+def test_tuples_with_same_fields_share_class():
+    first = as_namedtuple("ec2Instance", {"id": "i-1", "resized": False})
+    second = as_namedtuple("ec2Instance", {"id": "i-2", "resized": False})
+    other = as_namedtuple("ec2Instance", {"id": "i-3", "name": "web"})
+
+    assert type(first) is type(second)
+    assert type(first) is not type(other)
+    assert second._replace(resized=True) == ("i-2", True)
+    assert other.name == "web"